@@ -1,13 +1,16 @@
-import os
-from typing import Dict
+import time
+from typing import Callable, Dict, Optional
 from venv import logger
 from dotenv import load_dotenv
-import requests
+
+from ai_output import parse_cv_response
+from ai_scheduler import BULK, INTERACTIVE, AIBusy, ai_scheduler
+from gemini_client import gemini_client
+from prompt_cache import prompt_cache
 
 load_dotenv()
 
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 def enhance_with_ai(data: Dict) -> Dict:
     """Use AI to enhance the CV content"""
     try:
@@ -31,7 +34,7 @@ def enhance_with_ai(data: Dict) -> Dict:
         Skills: {', '.join(data.get('skills', []))}
         Languages: {', '.join(data.get('languages', []))}
         
-        Return enhanced content as a dictionary with:
+        Return enhanced content as a JSON object with:
         - summary (3-4 sentence professional summary)
         - experience (enhanced descriptions with achievements)
         - education
@@ -39,36 +42,26 @@ def enhance_with_ai(data: Dict) -> Dict:
         - languages
         - certifications (2-3 relevant ones)
         
-        Return ONLY a valid Python dictionary with no additional text or explanations.
-        The dictionary should be in this exact format:
+        Return ONLY valid JSON (double-quoted keys and strings) with no additional text or explanations.
+        The object should be in this exact format:
         {{
-            'summary': '...',
-            'experience': [...],
-            'education': [...],
-            'skills': {{...}},
-            'languages': [...],
-            'certifications': [...]
+            "summary": "...",
+            "experience": [{{"role": "...", "company": "...", "years": "...", "description": "..."}}],
+            "education": [{{"degree": "...", "institution": "...", "years": "..."}}],
+            "skills": {{"category": ["..."]}},
+            "languages": ["..."],
+            "certifications": ["..."]
         }}
         """
         
-        response = ask_gemini(prompt)
+        response = ask_gemini(prompt, json_mode=True, priority=BULK)
         
-        try:
-            # Find the first { and last } to extract just the dictionary
-            start = response.find('{')
-            end = response.rfind('}') + 1
-            dict_str = response[start:end]
-            
-            enhanced = eval(dict_str)
-            if isinstance(enhanced, dict):
-                for key in ['summary', 'experience', 'education', 'skills', 'languages', 'certifications']:
-                    if key in enhanced:
-                        data[key] = enhanced[key]
-        except Exception as e:
-            logger.warning(f"Couldn't parse AI response: {e}")
+        # Strict JSON parse with per-field validation; fields that fail keep the user's input
+        enhanced = parse_cv_response(response)
+        data.update(enhanced)
+        if 'skills' not in enhanced and 'skills' in data and isinstance(data['skills'], list):
             # Fallback: organize skills simply
-            if 'skills' in data and isinstance(data['skills'], list):
-                data['skills'] = {'technical': data['skills']}
+            data['skills'] = {'technical': data['skills']}
                 
     except Exception as e:
         logger.error(f"AI enhancement failed: {e}")
@@ -78,23 +71,77 @@ def enhance_with_ai(data: Dict) -> Dict:
     
     return data
 
-def ask_gemini(prompt: str) -> str:
-    """Get response from Gemini API"""
-    clean_prompt = f"""
+def _clean_prompt(prompt: str) -> str:
+    return f"""
     You are a professional CV writer. 
     Only return the requested CV content - no explanations, instructions or additional text.
     
     {prompt}
     """
-    
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
-    headers = {"Content-Type": "application/json"}
-    data = {"contents": [{"parts": [{"text": clean_prompt}]}]}
+
+
+def cached_response(prompt: str, json_mode: bool = False) -> Optional[str]:
+    """The cached `ask_gemini` answer for `prompt`, or None."""
+    return prompt_cache.get(_clean_prompt(prompt), gemini_client.model, json_mode)
+
+
+def cache_response(prompt: str, response: str, json_mode: bool = False):
+    """Store `response` as the `ask_gemini` answer for `prompt`, e.g. one item split out of a batch."""
+    prompt_cache.put(_clean_prompt(prompt), gemini_client.model, response, 0.0, json_mode)
+
+
+def ask_gemini(prompt: str, json_mode: bool = False, priority: int = INTERACTIVE) -> str:
+    """Get response from Gemini API; `json_mode` asks for a JSON-only response.
+
+    Returns "" when the request fails or the scheduler turns it away at `priority`.
+    """
+    clean_prompt = _clean_prompt(prompt)
+    cached = prompt_cache.get(clean_prompt, gemini_client.model, json_mode)
+    if cached is not None:
+        return cached
 
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=10)
-        response.raise_for_status()
-        return response.json()['candidates'][0]['content']['parts'][0]['text']
+        with ai_scheduler.slot(priority):
+            started = time.perf_counter()
+            response = gemini_client.generate(clean_prompt, json_mode=json_mode)
+        prompt_cache.put(clean_prompt, gemini_client.model, response, time.perf_counter() - started, json_mode)
+        return response
+    except AIBusy as e:
+        logger.warning(f"Skipping Gemini request: {e}")
+        return ""
     except Exception as e:
         logger.error(f"Gemini API Error: {e}")
         return ""
+
+
+def ask_gemini_stream(prompt: str, on_text: Callable[[str, bool], None], priority: int = INTERACTIVE) -> str:
+    """Like `ask_gemini`, but calls `on_text(text_so_far, final)` as the response streams in.
+
+    A cached response is delivered in one final call. Returns "" on failure,
+    in which case `on_text` is never called with `final=True`.
+    """
+    clean_prompt = _clean_prompt(prompt)
+    cached = prompt_cache.get(clean_prompt, gemini_client.model)
+    if cached is not None:
+        on_text(cached, True)
+        return cached
+
+    text = ""
+    try:
+        with ai_scheduler.slot(priority):
+            started = time.perf_counter()
+            for chunk in gemini_client.stream(clean_prompt):
+                text += chunk
+                on_text(text, False)
+        text = text.strip()
+        if not text:
+            return ""
+        prompt_cache.put(clean_prompt, gemini_client.model, text, time.perf_counter() - started)
+        on_text(text, True)
+        return text
+    except AIBusy as e:
+        logger.warning(f"Skipping Gemini request: {e}")
+        return ""
+    except Exception as e:
+        logger.error(f"Gemini streaming error: {e}")
+        return ""
@@ -0,0 +1,143 @@
+"""Batch job description rewrites into multi-item Gemini prompts.
+
+Each experience entry used to cost its own `ask_gemini` round trip. Rewrite
+requests are queued in a `BatchQueue`; whatever arrives within the batching
+window (from one user finishing their experience section, or from several
+users at once) is sent as one prompt asking for a JSON array of improved
+descriptions in the same order. If the answer is not an array of the right
+length, each item is retried with the single-item prompt. Each item is
+looked up in the prompt cache under its single-item prompt before it is
+queued, and the items of a batched answer are cached the same way, so a
+description already polished never costs a call, batched or not.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ai_output import parse_string_list
+from event_queue import BatchQueue
+
+logger = logging.getLogger(__name__)
+
+SINGLE_PROMPT = "Improve this job description professionally:\n{}"
+
+BATCH_PROMPT = """Improve each of these job descriptions professionally.
+Return ONLY a JSON array of exactly {count} strings: the improved descriptions, in the same order as given.
+
+{items}"""
+
+
+class RewriteBatcher:
+    def __init__(self, ask: Callable[..., str], window: float = 0.5, max_batch: int = 8,
+                 max_workers: int = 2, max_queue: int = 1000,
+                 cache_get: Optional[Callable[[str], Optional[str]]] = None,
+                 cache_put: Optional[Callable[[str, str], None]] = None):
+        self.ask = ask
+        # keyed by single-item prompt, shared with `ask`'s own cache
+        self.cache_get = cache_get
+        self.cache_put = cache_put
+        self._queue = BatchQueue(self._dispatch, name='ai-rewrites', max_queue=max_queue,
+                                 batch_size=max_batch, flush_interval=window)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-batch')
+        self._lock = threading.Lock()
+        self._items = 0
+        self._calls = 0
+        self._batches = 0
+        self._fallbacks = 0
+        self._cache_hits = 0
+        self._stopped = False
+
+    def submit(self, text: str) -> Future:
+        """Queue `text` for rewriting; the future resolves to the rewrite, or '' on failure.
+
+        Once the batcher is stopped the future fails with RuntimeError.
+        """
+        future: Future = Future()
+        if self._stopped:
+            future.set_exception(RuntimeError("Rewrite batcher is stopped"))
+            return future
+        cached = self._cached(text)
+        if cached is not None:
+            future.set_result(cached)
+            return future
+        self._queue.start()
+        if not self._queue.put((text, future)):
+            future.set_result('')
+        return future
+
+    def _cached(self, text: str) -> Optional[str]:
+        if self.cache_get is None:
+            return None
+        try:
+            cached = self.cache_get(SINGLE_PROMPT.format(text))
+        except Exception:
+            logger.exception("Prompt cache lookup failed")
+            return None
+        if cached is not None:
+            with self._lock:
+                self._cache_hits += 1
+        return cached
+
+    def _dispatch(self, batch: List[Tuple[str, Future]]):
+        # the queue's writer thread only forms batches; Gemini calls run on the executor
+        try:
+            self._executor.submit(self._send, batch)
+        except RuntimeError as e:
+            # the executor is shut down; fail the batch instead of leaving it unresolved
+            for _, future in batch:
+                future.set_exception(e)
+
+    def _send(self, batch: List[Tuple[str, Future]]):
+        texts = [text for text, _ in batch]
+        try:
+            results = self._rewrite(texts)
+        except Exception:
+            logger.exception("Batched rewrite of %s descriptions failed", len(texts))
+            results = [''] * len(texts)
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _call(self, prompt: str, json_mode: bool = False) -> str:
+        with self._lock:
+            self._calls += 1
+        return self.ask(prompt, json_mode=json_mode)
+
+    def _rewrite(self, texts: List[str]) -> List[str]:
+        with self._lock:
+            self._items += len(texts)
+        if len(texts) == 1:
+            return [self._call(SINGLE_PROMPT.format(texts[0]))]
+        with self._lock:
+            self._batches += 1
+        items = '\n'.join(f"{i}. {text}" for i, text in enumerate(texts, 1))
+        response = self._call(BATCH_PROMPT.format(count=len(texts), items=items), json_mode=True)
+        rewritten = parse_string_list(response, len(texts))
+        if rewritten is not None:
+            if self.cache_put is not None:
+                for text, result in zip(texts, rewritten):
+                    if result:
+                        self.cache_put(SINGLE_PROMPT.format(text), result)
+            return rewritten
+        logger.warning("Malformed batched rewrite for %s descriptions; retrying one by one", len(texts))
+        with self._lock:
+            self._fallbacks += 1
+        return [self._call(SINGLE_PROMPT.format(text)) for text in texts]
+
+    def stop(self):
+        self._stopped = True
+        self._queue.stop()
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'items': self._items,
+                'calls': self._calls,
+                'calls_saved': self._items - self._calls,
+                'batches': self._batches,
+                'fallbacks': self._fallbacks,
+                'cache_hits': self._cache_hits,
+                'depth': self._queue.stats()['depth'],
+            }
@@ -0,0 +1,182 @@
+"""Parse and validate Gemini's structured CV output.
+
+`enhance_with_ai` asks Gemini for a JSON object with summary, experience,
+education, skills, languages and certifications. Responses are parsed with
+a strict JSON parser (after stripping Markdown code fences), falling back to
+`ast.literal_eval` for Python-style dict literals, and never to `eval`.
+Each field is validated on its own, so one bad field does not discard the
+others; when the object as a whole does not parse (truncated output,
+trailing junk), fields are recovered one at a time from their keys.
+"""
+
+import ast
+import json
+import logging
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CV_FIELDS = ('summary', 'experience', 'education', 'skills', 'languages', 'certifications')
+
+_FENCE_RE = re.compile(r'^\s*```(?:json|python)?\s*|\s*```\s*$', re.IGNORECASE)
+_DECODER = json.JSONDecoder()
+
+
+def _str(value: Any) -> Optional[str]:
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        text = str(value).strip()
+        return text or None
+    return None
+
+
+def _str_list(value: Any) -> Optional[List[str]]:
+    if isinstance(value, str):
+        value = [v for v in value.split(',')]
+    if not isinstance(value, list):
+        return None
+    items = [s for s in (_str(v) for v in value) if s]
+    return items or None
+
+
+def _records(keys: Tuple[str, ...], required: str):
+    def validate(value: Any) -> Optional[List[Dict]]:
+        if not isinstance(value, list):
+            return None
+        records = []
+        for item in value:
+            if not isinstance(item, dict):
+                continue
+            record = {k: _str(item.get(k)) or '' for k in keys}
+            if record[required]:
+                records.append(record)
+        return records or None
+    return validate
+
+
+def _skills(value: Any):
+    if isinstance(value, dict):
+        categories = {str(k): items for k, items in ((k, _str_list(v)) for k, v in value.items()) if items}
+        return categories or None
+    return _str_list(value)
+
+
+# field -> validator returning the cleaned value, or None if unusable
+SCHEMA = {
+    'summary': _str,
+    'experience': _records(('role', 'company', 'years', 'description'), 'role'),
+    'education': _records(('degree', 'institution', 'years'), 'degree'),
+    'skills': _skills,
+    'languages': _str_list,
+    'certifications': _str_list,
+}
+
+
+class ParseStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self.partial = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    def record(self, outcome: str, seconds: float):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.seconds += seconds
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.parsed + self.partial + self.failed
+            return {
+                'responses': total,
+                'parsed': self.parsed,
+                'partial': self.partial,
+                'failed': self.failed,
+                'avg_parse_ms': (self.seconds / total * 1000) if total else 0.0,
+            }
+
+
+parse_stats = ParseStats()
+
+
+def _strip(text: str) -> str:
+    text = _FENCE_RE.sub('', text.strip())
+    start = text.find('{')
+    return text[start:] if start >= 0 else text
+
+
+def _load_object(text: str) -> Optional[Dict]:
+    """The first complete JSON (or Python literal) object in `text`, if any."""
+    try:
+        obj, _ = _DECODER.raw_decode(text)
+        return obj if isinstance(obj, dict) else None
+    except ValueError:
+        pass
+    end = text.rfind('}')
+    if end < 0:
+        return None
+    try:
+        obj = ast.literal_eval(text[:end + 1])
+        return obj if isinstance(obj, dict) else None
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def _recover_fields(text: str) -> Dict:
+    """Decode each known field's value independently, skipping the ones that are broken."""
+    recovered = {}
+    for field in CV_FIELDS:
+        match = re.search(r'["\']%s["\']\s*:\s*' % field, text)
+        if not match:
+            continue
+        try:
+            value, _ = _DECODER.raw_decode(text, match.end())
+        except ValueError:
+            continue
+        recovered[field] = value
+    return recovered
+
+
+def parse_cv_response(text: str) -> Dict:
+    """Validated CV fields from a Gemini response; missing or invalid fields are left out."""
+    started = time.perf_counter()
+    body = _strip(text or '')
+    raw = _load_object(body)
+    whole = raw is not None
+    if raw is None:
+        raw = _recover_fields(body)
+    result = {}
+    for field in CV_FIELDS:
+        if field in raw:
+            value = SCHEMA[field](raw[field])
+            if value is not None:
+                result[field] = value
+    if not result:
+        outcome = 'failed'
+    elif whole and len(result) == len([f for f in CV_FIELDS if f in raw]):
+        outcome = 'parsed'
+    else:
+        outcome = 'partial'
+    parse_stats.record(outcome, time.perf_counter() - started)
+    if outcome != 'parsed':
+        logger.warning("AI response %s: recovered %s", outcome, ', '.join(result) or 'nothing')
+    return result
+
+
+def parse_string_list(text: str, count: int) -> Optional[List[str]]:
+    """A JSON array of exactly `count` non-empty strings from a Gemini response, or None."""
+    body = _FENCE_RE.sub('', (text or '').strip())
+    start = body.find('[')
+    if start < 0:
+        return None
+    try:
+        items, _ = _DECODER.raw_decode(body, start)
+    except ValueError:
+        return None
+    if not isinstance(items, list) or len(items) != count:
+        return None
+    items = [_str(item) for item in items]
+    return items if all(items) else None
@@ -0,0 +1,223 @@
+"""Background Gemini rewrites for the CV conversation.
+
+`get_summary` and `get_experience` used to block the dispatcher thread on
+`ask_gemini` before asking the next question. The user's raw text is now
+stored right away and the rewrite runs on a small thread pool; when it
+arrives, the polished text replaces the raw text in place, unless the user
+has changed that field in the meantime. `review` and `generate_cv` call
+`wait` on the user's pending rewrites with a deadline, and anything still
+unfinished is abandoned: it keeps the raw text even if the rewrite arrives
+later, so the CV being reviewed or rendered does not change underneath. Job descriptions are held until the
+user finishes their experience section and then polished together through
+`ai_batcher.RewriteBatcher`.
+"""
+
+import logging
+import os
+import threading
+import time
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ai import ask_gemini, ask_gemini_stream, cache_response, cached_response
+from ai_batcher import RewriteBatcher
+from ai_scheduler import BULK
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    val = os.getenv(name)
+    try:
+        return float(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
+class AIRewriter:
+    def __init__(self, ask: Callable[[str], str], batcher: RewriteBatcher, max_workers: int = 4,
+                 wait_timeout: float = 8.0, ask_stream: Optional[Callable[..., str]] = None):
+        self.ask = ask
+        self.ask_stream = ask_stream
+        self.batcher = batcher
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-rewrite')
+        self._lock = threading.Lock()
+        # pending rewrite -> (set once `wait` gives up on it, callback to run when it does)
+        self._abandon: Dict[Future, Tuple[threading.Event, Optional[Callable[[], None]]]] = {}
+        self._submitted = 0
+        self._applied = 0
+        self._discarded = 0
+        self._abandoned = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._timeouts = 0
+
+    def _run(self, target: Dict, field: str, raw: str, prompt: str, abandoned: threading.Event) -> bool:
+        try:
+            polished = self.ask(prompt)
+        except Exception:
+            logger.exception("Background rewrite of %s failed", field)
+            polished = ''
+        return self._apply(target, field, raw, polished, abandoned)
+
+    def _run_streaming(self, target: Dict, field: str, raw: str, prompt: str,
+                       on_text: Callable[[str, bool], None], abandoned: threading.Event) -> bool:
+        try:
+            polished = self.ask_stream(prompt, on_text)
+        except Exception:
+            logger.exception("Streaming rewrite of %s failed", field)
+            polished = ''
+        if not polished:
+            # let the caller replace its placeholder with the text that was kept
+            try:
+                on_text(raw, True)
+            except Exception:
+                logger.exception("Failed to report the kept %s", field)
+        return self._apply(target, field, raw, polished, abandoned)
+
+    def _apply(self, target: Dict, field: str, raw: str, polished: str, abandoned: threading.Event) -> bool:
+        # under the lock so `wait` either sees the merge finished or stops it
+        with self._lock:
+            # only replace the text we were asked to polish; the user may have edited it since
+            applied = bool(polished) and not abandoned.is_set() and target.get(field) == raw
+            if applied:
+                target[field] = polished
+                self._applied += 1
+            else:
+                self._discarded += 1
+        return applied
+
+    def _track(self, pending: List[Future], future: Future, abandoned: threading.Event,
+               on_abandon: Optional[Callable[[], None]] = None):
+        with self._lock:
+            self._abandon[future] = (abandoned, on_abandon)
+            self._submitted += 1
+        future.add_done_callback(self._untrack)
+        pending.append(future)
+
+    def _untrack(self, future: Future):
+        with self._lock:
+            self._abandon.pop(future, None)
+
+    def rewrite(self, pending: List[Future], target: Dict, field: str, prompt: str) -> Future:
+        """Polish `target[field]` in the background; the raw text stays until the result arrives."""
+        abandoned = threading.Event()
+        future = self._executor.submit(self._run, target, field, target.get(field), prompt, abandoned)
+        self._track(pending, future, abandoned)
+        return future
+
+    def rewrite_streaming(self, pending: List[Future], target: Dict, field: str, prompt: str,
+                          on_text: Callable[[str, bool], None]) -> Future:
+        """Like `rewrite`, but `on_text(text_so_far, final)` sees the rewrite as it streams in.
+
+        If `wait` abandons the rewrite, `on_text` gets the kept raw text as the
+        final text and nothing from the stream after that.
+        """
+        raw = target.get(field)
+        abandoned = threading.Event()
+        # serialises stream updates with the switch to the kept text
+        gate = threading.Lock()
+
+        def report(text: str, final: bool):
+            with gate:
+                if not abandoned.is_set():
+                    on_text(text, final)
+
+        def keep_raw():
+            with gate:
+                try:
+                    on_text(raw, True)
+                except Exception:
+                    logger.exception("Failed to report the kept %s", field)
+
+        future = self._executor.submit(self._run_streaming, target, field, raw, prompt, report, abandoned)
+        self._track(pending, future, abandoned, keep_raw)
+        return future
+
+    def polish_batched(self, pending: List[Future], items: List[Tuple[Dict, str]]):
+        """Polish each `target[field]` in `items` through the batcher, as one Gemini call where possible."""
+        for target, field in items:
+            raw = target.get(field)
+            done: Future = Future()
+            abandoned = threading.Event()
+
+            def finish(result: Future, target=target, field=field, raw=raw, done=done, abandoned=abandoned):
+                # apply before resolving `done`, so `wait` never returns ahead of the merge
+                applied = False
+                try:
+                    applied = self._apply(target, field, raw, result.result(), abandoned)
+                except Exception:
+                    logger.exception("Batched rewrite of %s failed", field)
+                finally:
+                    done.set_result(applied)
+
+            self._track(pending, done, abandoned)
+            self.batcher.submit(raw).add_done_callback(finish)
+
+    def wait(self, pending: List[Future], timeout: Optional[float] = None) -> int:
+        """Wait up to `timeout` seconds for `pending` rewrites and return how many were abandoned.
+
+        Rewrites still running at the deadline are abandoned: their result is
+        discarded whenever it arrives, so the caller can use the CV as it is.
+        """
+        pending[:] = [f for f in pending if not f.done()]
+        if not pending:
+            return 0
+        started = time.perf_counter()
+        _, not_done = futures_wait(pending, timeout=self.wait_timeout if timeout is None else timeout)
+        pending[:] = []
+        callbacks = []
+        with self._lock:
+            for future in not_done:
+                abandoned, on_abandon = self._abandon.pop(future, (None, None))
+                if abandoned is not None:
+                    abandoned.set()
+                if on_abandon is not None:
+                    callbacks.append(on_abandon)
+            self._abandoned += len(not_done)
+            self._waits += 1
+            self._wait_seconds += time.perf_counter() - started
+            if not_done:
+                self._timeouts += 1
+        for callback in callbacks:
+            # may wait behind a stream update that is mid-request to Telegram
+            threading.Thread(target=callback, name='ai-rewrite-abandon', daemon=True).start()
+        if not_done:
+            logger.warning("%s AI rewrites still pending after the deadline; using the raw text", len(not_done))
+        return len(not_done)
+
+    def shutdown(self):
+        self.batcher.stop()
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'submitted': self._submitted,
+                'applied': self._applied,
+                'discarded': self._discarded,
+                'abandoned': self._abandoned,
+                'waits': self._waits,
+                'avg_wait_seconds': (self._wait_seconds / self._waits) if self._waits else 0.0,
+                'timeouts': self._timeouts,
+            }
+
+
+ai_rewriter = AIRewriter(
+    ask_gemini,
+    RewriteBatcher(
+        # job descriptions are polished in the background; the summary keeps the interactive lane
+        partial(ask_gemini, priority=BULK),
+        window=_env_float('AI_BATCH_WINDOW_MS', 500) / 1000,
+        max_batch=int(_env_float('AI_BATCH_MAX_ITEMS', 8)),
+        cache_get=cached_response,
+        cache_put=cache_response,
+    ),
+    max_workers=int(_env_float('AI_REWRITE_WORKERS', 4)),
+    wait_timeout=_env_float('AI_REWRITE_WAIT_SECONDS', 8),
+    ask_stream=ask_gemini_stream,
+)
@@ -0,0 +1,149 @@
+"""Process-wide admission control for Gemini requests.
+
+Every dispatcher and rewrite thread used to call Gemini on its own, so a
+burst of users reaching the summary step together ran straight into 429s.
+Requests now take a slot from the scheduler first: a token bucket keeps the
+request rate within the API quota, at most `max_in_flight` requests run at
+once, and waiting requests are admitted by lane, interactive before bulk,
+then in arrival order. A request that finds `max_queue` others already
+waiting, or that cannot be admitted within `max_wait` seconds, raises
+`AIBusy` so the caller can skip the rewrite and keep the user's text.
+"""
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+LANES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+
+def _env_float(name: str, default: float) -> float:
+    val = os.getenv(name)
+    try:
+        return float(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
+class AIBusy(Exception):
+    """Raised when a Gemini request is not admitted; the caller should skip it."""
+
+
+class AIScheduler:
+    def __init__(self, rate_per_minute: float = 60, burst: int = 5, max_in_flight: int = 4,
+                 max_queue: int = 20, max_wait: float = 10.0):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        # heap of (lane, arrival) for requests waiting to be admitted
+        self._waiting = []
+        self._arrivals = itertools.count()
+        self._in_flight = 0
+        self._lanes = {
+            lane: {'admitted': 0, 'rejected_full': 0, 'rejected_timeout': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+            for lane in LANES
+        }
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _can_admit(self, entry) -> bool:
+        return (self._waiting[0] == entry and self._in_flight < self.max_in_flight
+                and (self.rate <= 0 or self._tokens >= 1))
+
+    def _acquire(self, lane: int, max_wait: float):
+        started = time.monotonic()
+        deadline = started + max_wait
+        with self._cond:
+            counters = self._lanes[lane]
+            if len(self._waiting) >= self.max_queue:
+                counters['rejected_full'] += 1
+                raise AIBusy(f"{len(self._waiting)} Gemini requests already waiting")
+            entry = (lane, next(self._arrivals))
+            heapq.heappush(self._waiting, entry)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._can_admit(entry):
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    counters['rejected_timeout'] += 1
+                    self._cond.notify_all()
+                    raise AIBusy(f"Gemini request not admitted within {max_wait:.1f}s")
+                timeout = remaining
+                if self.rate > 0 and self._tokens < 1:
+                    # nobody releases a token; wake up when the bucket has one again
+                    timeout = min(timeout, (1 - self._tokens) / self.rate)
+                self._cond.wait(timeout)
+            heapq.heappop(self._waiting)
+            self._tokens -= 1
+            self._in_flight += 1
+            waited = time.monotonic() - started
+            counters['admitted'] += 1
+            counters['wait_seconds'] += waited
+            counters['max_wait_seconds'] = max(counters['max_wait_seconds'], waited)
+            # the next request in line may be admissible too
+            self._cond.notify_all()
+
+    def _release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, lane: int = INTERACTIVE, max_wait: Optional[float] = None) -> Iterator[None]:
+        """Hold an admitted request slot for the duration of the block; raises `AIBusy`."""
+        self._acquire(lane, self.max_wait if max_wait is None else max_wait)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            self._refill(time.monotonic())
+            stats = {
+                'in_flight': self._in_flight,
+                'waiting': len(self._waiting),
+                'tokens': self._tokens,
+            }
+            for lane, name in LANES.items():
+                counters = self._lanes[lane]
+                stats[name] = {
+                    'admitted': counters['admitted'],
+                    'rejected': counters['rejected_full'] + counters['rejected_timeout'],
+                    'rejected_full': counters['rejected_full'],
+                    'rejected_timeout': counters['rejected_timeout'],
+                    'avg_wait_ms': (counters['wait_seconds'] / counters['admitted'] * 1000) if counters['admitted'] else 0.0,
+                    'max_wait_ms': counters['max_wait_seconds'] * 1000,
+                }
+            return stats
+
+
+ai_scheduler = AIScheduler(
+    rate_per_minute=_env_float('AI_RATE_PER_MINUTE', 60),
+    burst=int(_env_float('AI_RATE_BURST', 5)),
+    max_in_flight=int(_env_float('AI_MAX_IN_FLIGHT', 4)),
+    max_queue=int(_env_float('AI_MAX_QUEUE', 20)),
+    max_wait=_env_float('AI_MAX_WAIT_SECONDS', 10),
+)
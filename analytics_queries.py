@@ -1,29 +1,34 @@
 import os
-import psycopg2
-from typing import List, Dict
-from datetime import datetime, timedelta
+from typing import List, Dict, Optional
+from datetime import date, datetime, timedelta
+
+from analytics_schema import ALL_ACTIONS, SKETCHES_ENABLED, refresh_rollups
+from hyperloglog import HyperLogLog
+from pg_pool import pg_pool
 
 class AnalyticsQueries:
-    def __init__(self):
+    def __init__(self, approximate: Optional[bool] = None):
         self.db_url = os.getenv('DATABASE_URL')
+        # Answer distinct counts over date ranges by merging the per-day
+        # HyperLogLog sketches kept when ANALYTICS_HLL=1
+        self.approximate = SKETCHES_ENABLED if approximate is None else approximate
 
     def get_connection(self):
-        return psycopg2.connect(self.db_url)
+        """Borrow a pooled connection; use as a context manager"""
+        return pg_pool.connection()
 
     def get_daily_active_users(self, days: int = 7) -> List[Dict]:
         """Get daily active users for the last N days"""
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
+                refresh_rollups(cursor)
                 cursor.execute('''
-                    SELECT 
-                        DATE(timestamp) as day,
-                        COUNT(DISTINCT user_id) as active_users
-                    FROM user_actions
-                    WHERE timestamp >= %s
-                    GROUP BY day
+                    SELECT day, users as active_users
+                    FROM analytics_daily_action_counts
+                    WHERE action_type = %s AND day > %s
                     ORDER BY day DESC
                     LIMIT %s
-                ''', (datetime.now() - timedelta(days=days), days))
+                ''', (ALL_ACTIONS, (datetime.now() - timedelta(days=days)).date(), days))
                 return [
                     {'date': row[0], 'users': row[1]}
                     for row in cursor.fetchall()
@@ -33,13 +38,16 @@ class AnalyticsQueries:
         """Get conversion funnel metrics"""
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
+                refresh_rollups(cursor)
                 # Example funnel: started -> completed profile -> generated CV
+                # Each user counts once, on the first day they did the action
                 cursor.execute('''
                     SELECT 
-                        COUNT(DISTINCT CASE WHEN action_type = 'session_started' THEN user_id END) as started,
-                        COUNT(DISTINCT CASE WHEN action_type = 'profile_completed' THEN user_id END) as completed_profile,
-                        COUNT(DISTINCT CASE WHEN action_type = 'cv_generated' THEN user_id END) as generated_cv
-                    FROM user_actions
+                        COALESCE(SUM(new_users) FILTER (WHERE action_type = 'session_started'), 0) as started,
+                        COALESCE(SUM(new_users) FILTER (WHERE action_type = 'profile_completed'), 0) as completed_profile,
+                        COALESCE(SUM(new_users) FILTER (WHERE action_type = 'cv_generated'), 0) as generated_cv
+                    FROM analytics_daily_action_counts
+                    WHERE action_type IN ('session_started', 'profile_completed', 'cv_generated')
                 ''')
                 row = cursor.fetchone()
                 return {
@@ -48,6 +56,32 @@ class AnalyticsQueries:
                     'generated_cv': row[2]
                 }
 
+    def get_distinct_users(self, start: date, end: date, action_type: str = ALL_ACTIONS) -> int:
+        """Distinct users who did `action_type` (any action by default) between two days inclusive
+
+        Approximate when sketches are enabled and cover every day in the range,
+        exact otherwise.
+        """
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                refresh_rollups(cursor)
+                if self.approximate:
+                    cursor.execute('''
+                        SELECT users_sketch FROM analytics_daily_action_counts
+                        WHERE action_type = %s AND day BETWEEN %s AND %s AND users > 0
+                    ''', (action_type, start, end))
+                    sketches = [row[0] for row in cursor.fetchall()]
+                    if all(sketches):
+                        merged = HyperLogLog()
+                        for sketch in sketches:
+                            merged.merge(HyperLogLog.from_bytes(sketch))
+                        return merged.count()
+                cursor.execute('''
+                    SELECT COUNT(DISTINCT user_id) FROM analytics_daily_user_actions
+                    WHERE action_type = %s AND day BETWEEN %s AND %s
+                ''', (action_type, start, end))
+                return cursor.fetchone()[0]
+
     def get_feedback_stats(self) -> Dict:
         """Get feedback statistics"""
         with self.get_connection() as conn:
@@ -0,0 +1,338 @@
+"""Versioned migrations and daily rollups for the analytics schema.
+
+`UserAnalytics._init_db` creates the original tables; `migrate` then applies
+every migration newer than the version recorded in `schema_migrations`:
+secondary indexes, monthly range partitioning of `user_actions` and the
+daily rollups. `refresh_rollups` folds in only the `user_actions` rows not
+counted yet: those above the stored id watermark, plus earlier ids that were
+missing last time:
+
+* `analytics_daily_user_actions` – one row per day, action type and user,
+  with the action count. Action type `'*'` holds every action.
+* `analytics_daily_action_counts` – per day and action type, the distinct
+  users that day and the users seen for that action type for the first time
+  ever, so daily actives and all-time funnels are sums over days. With
+  sketches enabled it also keeps a HyperLogLog of that day's users.
+* `analytics_action_first_seen` – the first day each user did each action.
+
+Ids come from one sequence but are taken at insert time, so a transaction
+can commit a lower id after a refresh has already moved the watermark past
+it. Every id at or below the watermark that was not visible is kept in
+`analytics_rollup_gaps` and folded in once its row shows up; gaps older than
+`ANALYTICS_ROLLUP_GAP_SECONDS` are assumed to be rolled-back inserts and
+dropped.
+"""
+
+import logging
+import os
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Callable, List, Tuple
+
+from hyperloglog import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    val = os.getenv(name)
+    try:
+        return int(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
+# Advisory locks serialising migrations and rollup refreshes across bot instances
+_MIGRATION_LOCK_ID = 727301
+_ROLLUP_LOCK_ID = 727302
+
+# Pseudo action type aggregating every action, used for daily actives
+ALL_ACTIONS = '*'
+
+# Every refresh must agree on this, or a day's sketch misses some users
+SKETCHES_ENABLED = os.getenv('ANALYTICS_HLL', '').strip().lower() in ('1', 'true', 'yes')
+
+PARTITION_MONTHS_AHEAD = 2
+
+# How long a missing id may still commit before it is treated as rolled back
+ROLLUP_GAP_SECONDS = _env_int('ANALYTICS_ROLLUP_GAP_SECONDS', 3600)
+
+
+def _month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def _next_month(d: date) -> date:
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _is_partitioned(cursor, table: str) -> bool:
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def ensure_partitions(cursor, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """Create monthly `user_actions` partitions from this month to `months_ahead` months out.
+
+    Rows already sitting in the default partition for a new month are moved
+    into it before it is attached.
+    """
+    if not _is_partitioned(cursor, 'user_actions'):
+        return
+    start = _month_start(date.today())
+    for _ in range(months_ahead + 1):
+        end = _next_month(start)
+        name = f"user_actions_y{start.year}m{start.month:02d}"
+        cursor.execute("SELECT to_regclass(%s)", (name,))
+        if cursor.fetchone()[0] is None:
+            cursor.execute(f"CREATE TABLE {name} (LIKE user_actions INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            cursor.execute(f'''
+                WITH moved AS (
+                    DELETE FROM user_actions_default
+                    WHERE timestamp >= %s AND timestamp < %s
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            ''', (start, end))
+            cursor.execute(f"ALTER TABLE user_actions ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                           (start, end))
+            logger.info("Created analytics partition %s", name)
+        start = end
+
+
+def _partition_user_actions(cursor):
+    if _is_partitioned(cursor, 'user_actions'):
+        return
+    # Keep the id sequence alive when the old table is dropped
+    cursor.execute("ALTER SEQUENCE user_actions_id_seq OWNED BY NONE")
+    cursor.execute('''
+        CREATE TABLE user_actions_partitioned (
+            id INTEGER NOT NULL DEFAULT nextval('user_actions_id_seq'),
+            user_id BIGINT NOT NULL REFERENCES users(user_id),
+            action_type TEXT NOT NULL,
+            action_data JSONB,
+            timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    ''')
+    cursor.execute("CREATE TABLE user_actions_default PARTITION OF user_actions_partitioned DEFAULT")
+    cursor.execute('''
+        INSERT INTO user_actions_partitioned (id, user_id, action_type, action_data, timestamp)
+        SELECT id, user_id, action_type, action_data, COALESCE(timestamp, CURRENT_TIMESTAMP)
+        FROM user_actions
+    ''')
+    cursor.execute("DROP TABLE user_actions")
+    cursor.execute("ALTER TABLE user_actions_partitioned RENAME TO user_actions")
+    cursor.execute("ALTER SEQUENCE user_actions_id_seq OWNED BY user_actions.id")
+    ensure_partitions(cursor)
+
+
+def _add_indexes(cursor):
+    # Created on the partitioned parent, so every partition gets them
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_actions_timestamp ON user_actions (timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_actions_type_user ON user_actions (action_type, user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_actions_user_timestamp ON user_actions (user_id, timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_feedback_timestamp ON user_feedback (timestamp)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_sessions_user ON user_sessions (user_id, session_start)")
+
+
+def _add_rollups(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_daily_user_actions (
+            day DATE NOT NULL,
+            action_type TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            actions INTEGER NOT NULL,
+            PRIMARY KEY (day, action_type, user_id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_user_actions_type ON analytics_daily_user_actions (action_type, day)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_rollup_state (
+            name TEXT PRIMARY KEY,
+            refreshed_from DATE NOT NULL
+        )
+    ''')
+
+
+def _add_incremental_counts(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_daily_action_counts (
+            day DATE NOT NULL,
+            action_type TEXT NOT NULL,
+            users INTEGER NOT NULL DEFAULT 0,
+            new_users INTEGER NOT NULL DEFAULT 0,
+            users_sketch BYTEA,
+            PRIMARY KEY (day, action_type)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_action_first_seen (
+            action_type TEXT NOT NULL,
+            user_id BIGINT NOT NULL,
+            first_day DATE NOT NULL,
+            PRIMARY KEY (action_type, user_id)
+        )
+    ''')
+    cursor.execute("ALTER TABLE analytics_rollup_state ADD COLUMN IF NOT EXISTS watermark BIGINT NOT NULL DEFAULT 0")
+    cursor.execute("ALTER TABLE analytics_rollup_state ALTER COLUMN refreshed_from DROP NOT NULL")
+    # Rebuild the day-based rollup from the id watermark on the next refresh
+    cursor.execute("TRUNCATE analytics_daily_user_actions")
+    cursor.execute("DELETE FROM analytics_rollup_state WHERE name = 'daily_user_actions'")
+
+
+def _add_rollup_gaps(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_rollup_gaps (
+            id BIGINT PRIMARY KEY,
+            seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+# (version, description, apply) in order; never edit an applied migration, add a new one
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, 'partition user_actions by month', _partition_user_actions),
+    (2, 'secondary indexes for dashboard queries', _add_indexes),
+    (3, 'daily user action rollup', _add_rollups),
+    (4, 'watermark-based daily distinct counts', _add_incremental_counts),
+    (5, 'ids committed behind the rollup watermark', _add_rollup_gaps),
+]
+
+
+def migrate(cursor):
+    """Apply pending migrations inside the caller's transaction."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_ID,))
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    current = cursor.fetchone()[0]
+    for version, description, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info("Applying analytics migration %s: %s", version, description)
+        apply(cursor)
+        cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                       (version, description))
+    ensure_partitions(cursor)
+
+
+def refresh_rollups(cursor):
+    """Fold `user_actions` rows not counted yet into the daily rollups.
+
+    Those are the rows above the watermark, and rows for ids earlier refreshes
+    recorded as gaps that have committed since. Cost is proportional to the rows added since the previous refresh. With
+    `ANALYTICS_HLL=1` the day's HyperLogLog sketches are updated as well.
+    """
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (_ROLLUP_LOCK_ID,))
+    # a bot running across a month boundary needs the new month's partition
+    ensure_partitions(cursor)
+    cursor.execute("SELECT watermark FROM analytics_rollup_state WHERE name = 'daily_user_actions'")
+    row = cursor.fetchone()
+    watermark = row[0] if row else 0
+    cursor.execute("SELECT MAX(id) FROM user_actions WHERE id > %s", (watermark,))
+    high = cursor.fetchone()[0] or watermark
+
+    cursor.execute("DROP TABLE IF EXISTS new_actions")
+    cursor.execute('''
+        CREATE TEMP TABLE new_actions ON COMMIT DROP AS
+        SELECT id, DATE(timestamp) AS day, action_type, user_id
+        FROM user_actions
+        WHERE id > %(low)s AND id <= %(high)s
+        UNION ALL
+        SELECT a.id, DATE(a.timestamp), a.action_type, a.user_id
+        FROM user_actions a JOIN analytics_rollup_gaps g ON g.id = a.id
+    ''', {'low': watermark, 'high': high})
+    # Gaps whose rows have committed are counted below; very old ones never will be
+    cursor.execute('''
+        DELETE FROM analytics_rollup_gaps
+        WHERE id IN (SELECT id FROM new_actions)
+           OR seen_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+    ''', (ROLLUP_GAP_SECONDS,))
+    # Ids the watermark passes without seeing may belong to transactions still open
+    cursor.execute('''
+        INSERT INTO analytics_rollup_gaps (id)
+        SELECT g FROM generate_series(%(low)s + 1, %(high)s) AS g
+        WHERE NOT EXISTS (SELECT 1 FROM new_actions n WHERE n.id = g)
+        ON CONFLICT (id) DO NOTHING
+    ''', {'low': watermark, 'high': high})
+    cursor.execute('''
+        INSERT INTO analytics_rollup_state (name, watermark)
+        VALUES ('daily_user_actions', %s)
+        ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark
+    ''', (high,))
+
+    cursor.execute("DROP TABLE IF EXISTS new_user_days")
+    cursor.execute('''
+        CREATE TEMP TABLE new_user_days ON COMMIT DROP AS
+        SELECT day, action_type, user_id, COUNT(*) AS actions
+        FROM new_actions
+        GROUP BY 1, 2, 3
+        UNION ALL
+        SELECT day, %s, user_id, COUNT(*)
+        FROM new_actions
+        GROUP BY 1, 3
+    ''', (ALL_ACTIONS,))
+
+    # Users new to a day add to that day's distinct count
+    cursor.execute('''
+        WITH upserted AS (
+            INSERT INTO analytics_daily_user_actions AS d (day, action_type, user_id, actions)
+            SELECT day, action_type, user_id, actions FROM new_user_days
+            ON CONFLICT (day, action_type, user_id) DO UPDATE SET actions = d.actions + EXCLUDED.actions
+            RETURNING day, action_type, (xmax = 0) AS inserted
+        )
+        INSERT INTO analytics_daily_action_counts AS c (day, action_type, users)
+        SELECT day, action_type, COUNT(*) FILTER (WHERE inserted) FROM upserted GROUP BY 1, 2
+        ON CONFLICT (day, action_type) DO UPDATE SET users = c.users + EXCLUDED.users
+    ''')
+    # Users new to an action type add to the all-time funnel count of their first day
+    cursor.execute('''
+        WITH first_seen AS (
+            INSERT INTO analytics_action_first_seen (action_type, user_id, first_day)
+            SELECT action_type, user_id, MIN(day) FROM new_user_days GROUP BY 1, 2
+            ON CONFLICT (action_type, user_id) DO NOTHING
+            RETURNING action_type, first_day
+        )
+        INSERT INTO analytics_daily_action_counts AS c (day, action_type, new_users)
+        SELECT first_day, action_type, COUNT(*) FROM first_seen GROUP BY 1, 2
+        ON CONFLICT (day, action_type) DO UPDATE SET new_users = c.new_users + EXCLUDED.new_users
+    ''')
+    if SKETCHES_ENABLED:
+        _update_sketches(cursor)
+
+
+def _update_sketches(cursor):
+    cursor.execute("SELECT day, action_type, user_id FROM new_user_days")
+    users = defaultdict(list)
+    for day, action_type, user_id in cursor.fetchall():
+        users[(day, action_type)].append(user_id)
+    if not users:
+        return
+    cursor.execute('''
+        SELECT day, action_type, users_sketch FROM analytics_daily_action_counts
+        WHERE (day, action_type) IN (SELECT DISTINCT day, action_type FROM new_user_days)
+    ''')
+    stored = {(day, action_type): sketch for day, action_type, sketch in cursor.fetchall()}
+    for key, user_ids in users.items():
+        if stored.get(key):
+            sketch = HyperLogLog.from_bytes(stored[key])
+        else:
+            # first sketch for this day: seed it with everyone already counted
+            cursor.execute(
+                "SELECT user_id FROM analytics_daily_user_actions WHERE day = %s AND action_type = %s", key
+            )
+            sketch = HyperLogLog()
+            user_ids = [row[0] for row in cursor.fetchall()]
+        sketch.update(user_ids)
+        cursor.execute(
+            "UPDATE analytics_daily_action_counts SET users_sketch = %s WHERE day = %s AND action_type = %s",
+            (sketch.to_bytes(), key[0], key[1]),
+        )
@@ -0,0 +1,53 @@
+"""Parse latency and recovery for the Gemini response fixture corpus.
+
+Every file in `fixtures/gemini_responses/` is a Gemini answer to the
+`enhance_with_ai` prompt, well-formed or not. Each is parsed `--runs` times
+with `ai_output.parse_cv_response`; the report lists the fields recovered
+per fixture, its median parse time and the overall outcome counters.
+
+    python benchmarks/ai_parse_bench.py --runs 200
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_output import parse_cv_response, parse_stats  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'gemini_responses')
+
+
+def run(runs: int) -> dict:
+    fixtures = {}
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+            text = f.read()
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = parse_cv_response(text)
+            samples.append(time.perf_counter() - started)
+        fixtures[name] = {
+            'fields': sorted(result),
+            'median_us': round(statistics.median(samples) * 1e6, 1),
+        }
+    return {'runs': runs, 'fixtures': fixtures, 'outcomes': parse_stats.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=100, help='parses per fixture')
+    args = parser.parse_args()
+    # recovery warnings would be logged once per run
+    logging.disable(logging.WARNING)
+    print(json.dumps(run(args.runs), indent=2))
+
+
+if __name__ == '__main__':
+    main()
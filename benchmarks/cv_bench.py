@@ -0,0 +1,178 @@
+"""Offline latency, memory and size benchmark for generateDocs.
+
+Builds synthetic `cv_data` dicts shaped like the ones the bot produces after
+`ai.enhance_with_ai` (1-30 experience entries with long descriptions,
+categorised skill dicts, with and without a photo) and runs `generate_pdf`
+for each CV template plus `generate_docx`. Every target runs in its own
+fresh process so its peak RSS is not inflated by the targets before it, and
+the render cache is disabled so every run does a full layout. No Telegram
+token, Gemini key or network access is needed.
+
+    python benchmarks/cv_bench.py --runs 5 --output bench.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# Must be set before render_cache is imported in the worker processes
+os.environ['RENDER_CACHE_ENABLED'] = '0'
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+TEMPLATES = ('professional', 'modern', 'creative', 'academic')
+TARGETS = tuple(f'pdf:{name}' for name in TEMPLATES) + ('docx',)
+DEFAULT_SIZES = (1, 5, 15, 30)
+
+_WORDS = (
+    'designed built migrated optimised automated led delivered scaled reduced improved '
+    'payments platform pipeline latency throughput customers reliability dashboards '
+    'services infrastructure team stakeholders releases incidents onboarding costs'
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(_WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def synthetic_cv(experience_count: int, photo_path: Optional[str] = None, seed: int = 0) -> Dict:
+    """A CV dict with `experience_count` jobs and AI-length descriptions."""
+    rng = random.Random(seed)
+    return {
+        'name': f'Bench User {experience_count}',
+        'email': 'bench.user@example.com',
+        'phone': '+251 900 000 000',
+        'linkedin': 'https://linkedin.com/in/bench-user',
+        'portfolio': 'https://bench-user.dev',
+        'template': 'professional',
+        'photo_path': photo_path,
+        'summary': ' '.join(_sentence(rng, 18) for _ in range(4)),
+        'experience': [
+            {
+                'role': f'Engineer {i + 1}',
+                'company': f'Company {i + 1}',
+                'years': f'{2024 - 2 * i - 2}-{2024 - 2 * i}',
+                'description': ' '.join(_sentence(rng, 20) for _ in range(5)),
+            }
+            for i in range(experience_count)
+        ],
+        'education': [
+            {'degree': 'MSc Computer Science', 'institution': 'Addis Ababa University', 'years': '2012-2014'},
+            {'degree': 'BSc Computer Science', 'institution': 'Bahir Dar University', 'years': '2008-2012'},
+        ],
+        'skills': {
+            'technical': ['Python', 'PostgreSQL', 'Docker', 'Kubernetes', 'Terraform', 'Redis'],
+            'soft': ['Mentoring', 'Communication', 'Planning'],
+            'tools': ['Git', 'Grafana', 'Jira'],
+        },
+        'languages': ['English', 'Amharic', 'Oromo'],
+        'certifications': ['AWS Certified Developer', 'Certified Kubernetes Administrator'],
+        'projects': [
+            {'name': f'Project {i + 1}', 'technologies': 'Python, Flask', 'description': _sentence(rng, 25)}
+            for i in range(3)
+        ],
+    }
+
+
+def _make_photo(directory: str) -> str:
+    # A phone-camera sized JPEG, the common case for Telegram uploads
+    from PIL import Image
+
+    path = os.path.join(directory, 'bench_photo.jpg')
+    Image.new('RGB', (1280, 1280), (120, 140, 160)).save(path, 'JPEG', quality=90)
+    return path
+
+
+def _peak_rss_mb() -> float:
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _run_target(target: str, sizes: List[int], runs: int, photo_path: str) -> Dict:
+    """Worker entry point: benchmark one target over every case."""
+    import generateDocs
+
+    kind, _, template = target.partition(':')
+    cases = {}
+    all_samples: List[float] = []
+    for size in sizes:
+        for with_photo in (False, True):
+            data = synthetic_cv(size, photo_path if with_photo else None, seed=size)
+            data['name'] = f"bench_{kind}_{template or 'docx'}_{size}_{int(with_photo)}"
+            if template:
+                data['template'] = template
+            samples = []
+            output_bytes = 0
+            for _ in range(runs):
+                started = time.perf_counter()
+                path = generateDocs.generate_pdf(data) if kind == 'pdf' else generateDocs.generate_docx(data)
+                samples.append(time.perf_counter() - started)
+                output_bytes = os.path.getsize(path)
+                os.remove(path)
+            all_samples.extend(samples)
+            cases[f"{size}_exp{'_photo' if with_photo else ''}"] = {
+                'p50_ms': round(statistics.median(samples) * 1000, 1),
+                'p95_ms': round(_percentile(samples, 95) * 1000, 1),
+                'output_bytes': output_bytes,
+            }
+    return {
+        'p50_ms': round(statistics.median(all_samples) * 1000, 1),
+        'p95_ms': round(_percentile(all_samples, 95) * 1000, 1),
+        'peak_rss_mb': _peak_rss_mb(),
+        'cases': cases,
+    }
+
+
+def run(targets: List[str], sizes: List[int], runs: int) -> Dict:
+    ctx = multiprocessing.get_context('spawn')
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        photo_path = _make_photo(tmp)
+        for target in targets:
+            # one fresh process per target so peak RSS is per target
+            with ctx.Pool(1) as pool:
+                results[target] = pool.apply(_run_target, (target, sizes, runs, photo_path))
+    return {
+        'runs': runs,
+        'sizes': list(sizes),
+        'python': sys.version.split()[0],
+        'targets': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='renders per case')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='experience entry counts to generate (default: %(default)s)')
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS))
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = json.dumps(run(args.targets, args.sizes, args.runs), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
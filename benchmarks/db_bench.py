@@ -0,0 +1,97 @@
+"""Concurrent save/load throughput of `db.DBWrapper`.
+
+Each mode gets a fresh SQLite file in a temporary directory. `--threads`
+threads each save and reload `--ops` CVs for their own users; the report
+lists saves/s and loads/s, commits and rows per commit. `sync` commits every
+save on the calling thread (WAL, `synchronous=NORMAL`); `write_behind`
+queues saves for group commit; `rollback` is `sync` on the default rollback
+journal with `synchronous=FULL`, as the wrapper used to run.
+
+    python benchmarks/db_bench.py --threads 8 --ops 500
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import DBWrapper  # noqa: E402
+
+MODES = ('rollback', 'sync', 'write_behind')
+
+
+def _cv(user_id: int, i: int) -> dict:
+    return {
+        'name': f'User {user_id}', 'email': f'user{user_id}@example.com', 'summary': 'x' * 400,
+        'experience': [{'role': 'Engineer', 'company': 'Acme', 'years': '2020-2024', 'description': 'y' * 300}] * 5,
+        'skills': ['Python', 'SQL'], 'revision': i,
+    }
+
+
+def _run_mode(mode: str, threads: int, ops: int, directory: str) -> dict:
+    db = DBWrapper(os.path.join(directory, f'{mode}.db'), os.path.join(directory, f'{mode}.json'),
+                   write_behind=(mode == 'write_behind'))
+    if mode == 'rollback':
+        db._conn.execute("PRAGMA journal_mode=DELETE")
+        db._conn.execute("PRAGMA synchronous=FULL")
+    timings = {'save': 0.0, 'load': 0.0}
+    lock = threading.Lock()
+    stale = []
+
+    def worker(t: int):
+        save_seconds = load_seconds = 0.0
+        for i in range(ops):
+            user_id = t * ops + i % 50
+            started = time.perf_counter()
+            db.save_user_data(user_id, _cv(user_id, i))
+            save_seconds += time.perf_counter() - started
+            started = time.perf_counter()
+            loaded = db.load_user_data(user_id)
+            load_seconds += time.perf_counter() - started
+            if not loaded or loaded['revision'] != i:
+                stale.append(user_id)
+        with lock:
+            timings['save'] += save_seconds
+            timings['load'] += load_seconds
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    db.close()
+    stats = db.stats()
+    total = threads * ops
+    return {
+        'seconds': round(elapsed, 3),
+        'saves_per_second': round(total / elapsed),
+        'avg_save_ms': round(timings['save'] / total * 1000, 3),
+        'avg_load_ms': round(timings['load'] / total * 1000, 3),
+        'commits': stats['commits'],
+        'rows_per_commit': round(stats['rows_per_commit'], 1),
+        'stale_reads': len(stale),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=300, help='save+load pairs per thread')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as directory:
+        results = {mode: _run_mode(mode, args.threads, args.ops, directory) for mode in args.modes}
+    print(json.dumps({'threads': args.threads, 'ops': args.ops, 'modes': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
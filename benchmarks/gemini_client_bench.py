@@ -0,0 +1,121 @@
+"""Connection reuse and retry behaviour of `GeminiClient` against a local stub.
+
+A stub `generateContent` server on 127.0.0.1 answers every request with a
+canned candidate and counts the TCP connections it accepts. The same number
+of calls is made through the pooled client and through one-off
+`requests.post` calls (the old `ask_gemini`); the report shows connections
+opened and per-call latency for each. `--fail-every N` makes the stub answer
+every Nth request with a 503 to exercise the retry path.
+
+    python benchmarks/gemini_client_bench.py --calls 200 --fail-every 10
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gemini_client import GeminiClient  # noqa: E402
+
+REPLY = json.dumps({'candidates': [{'content': {'parts': [{'text': 'Polished text.'}]}}]}).encode()
+
+
+class _Stub(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # buffer the headers and body into one send, and don't let Nagle hold
+    # it back waiting for a delayed ACK; either would add ~40ms per request
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    connections = 0
+    requests = 0
+    fail_every = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _Stub.lock:
+            _Stub.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with _Stub.lock:
+            _Stub.requests += 1
+            fail = _Stub.fail_every and _Stub.requests % _Stub.fail_every == 0
+        status, body = (503, b'{}') if fail else (200, REPLY)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _reset(fail_every: int):
+    _Stub.connections = 0
+    _Stub.requests = 0
+    _Stub.fail_every = fail_every
+
+
+def _summary(samples, client_stats=None) -> dict:
+    result = {
+        'connections': _Stub.connections,
+        'server_requests': _Stub.requests,
+        'p50_ms': round(statistics.median(samples) * 1000, 2),
+        'p95_ms': round(sorted(samples)[int(len(samples) * 0.95) - 1] * 1000, 2),
+    }
+    if client_stats:
+        result.update(retries=client_stats['retries'], failures=client_stats['failures'])
+    return result
+
+
+def run(calls: int, fail_every: int) -> dict:
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+    try:
+        _reset(fail_every)
+        client = GeminiClient('stub-key', base_url=base_url, pool_size=2, backoff=0.001)
+        samples = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            client.generate('Rewrite this professionally')
+            samples.append(time.perf_counter() - started)
+        pooled = _summary(samples, client.stats())
+
+        _reset(0)
+        samples = []
+        body = {'contents': [{'parts': [{'text': 'Rewrite this professionally'}]}]}
+        for _ in range(calls):
+            started = time.perf_counter()
+            requests.post(client.url(), json=body, timeout=10).json()
+            samples.append(time.perf_counter() - started)
+        unpooled = _summary(samples)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return {'calls': calls, 'fail_every': fail_every, 'pooled': pooled, 'per_call': unpooled}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--fail-every', type=int, default=0, help='answer every Nth request with a 503')
+    args = parser.parse_args()
+    # retry warnings would be logged for every injected 503
+    logging.disable(logging.WARNING)
+    print(json.dumps(run(args.calls, args.fail_every), indent=2))
+
+
+if __name__ == '__main__':
+    main()
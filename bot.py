@@ -1,8 +1,10 @@
+import io
 import os
 import logging
 import sqlite3
 import sys
 import threading
+import time
 
 
 from docx import Document
@@ -11,9 +13,10 @@ from telegram.ext import ContextTypes
 from db_comments import save_user_comment
 
 from telegram import (
-    Update, InputFile,
+    Update,
     InlineKeyboardButton, InlineKeyboardMarkup
 )
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     Updater, CommandHandler, MessageHandler, Filters,
     ConversationHandler, CallbackContext, CallbackQueryHandler
@@ -35,9 +38,16 @@ for k, v in (_dot.items() if _dot else []):
     if k and (os.getenv(k) is None or os.getenv(k) == '') and v is not None:
         os.environ[k] = v
 
-from ai import ask_gemini
-from db import save_user_data
-from generateDocs import generate_docx, generate_pdf
+from ai_rewrites import ai_rewriter
+from ai_output import parse_stats
+from ai_scheduler import ai_scheduler
+from gemini_client import gemini_client
+from prompt_cache import prompt_cache
+from db import close as close_db, save_user_data, stats as db_stats
+from pg_pool import pg_pool
+from photo_handler import PhotoHandler
+from render_worker import RenderQueueFull, RenderTimeout, render_pool
+from template_registry import template_registry
 from social_links import social_links_handler
 from user_analytics import analytics
 from feedback import feedback_conversation
@@ -62,6 +72,14 @@ try:
     ADMIN_USER_ID = int(_admin_id_val) if _admin_id_val and _admin_id_val.strip() else None
 except ValueError:
     ADMIN_USER_ID = None
+# Minimum seconds between edits of a streamed message; Telegram throttles faster edits
+_edit_interval_val = os.getenv('SUMMARY_STREAM_EDIT_SECONDS')
+try:
+    SUMMARY_EDIT_INTERVAL = float(_edit_interval_val) if _edit_interval_val and _edit_interval_val.strip() else 1.0
+except ValueError:
+    SUMMARY_EDIT_INTERVAL = 1.0
+# Attempts at the final edit of a streamed message before the placeholder is left as is
+SUMMARY_FINAL_EDIT_ATTEMPTS = 5
 
 # Validate TELEGRAM token early and fail with a clear error if missing
 if not TELEGRAM_TOKEN or TELEGRAM_TOKEN.strip() == "":
@@ -93,6 +111,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 # Ensure directories exist
 os.makedirs(TEMP_DIR, exist_ok=True)
 os.makedirs(TEMPLATES_DIR, exist_ok=True)
+photo_handler = PhotoHandler(TEMP_DIR)
 
 # DB setup
 def init_db():
@@ -279,7 +298,10 @@ def start(update: Update, context: CallbackContext) -> int:
                 "/payment_status - show payment settings\n"
                 "/mark_paid <user_id> - mark a user paid\n"
                 "/mark_unpaid <user_id> - remove paid status\n"
-                "/list_paid - list paid users"
+                "/list_paid - list paid users\n"
+                "/render_stats - show render cache statistics\n"
+                "/db_stats - show database pool statistics\n"
+                "/ai_stats - show AI response statistics"
             )
             update.message.reply_text(admin_text)
     except Exception:
@@ -328,18 +350,16 @@ def select_template(update: Update, context: CallbackContext) -> int:
 
 def receive_photo(update: Update, context: CallbackContext) -> int:
     """Handle photo upload"""
-    try:
-        photo_file = update.message.photo[-1].get_file()
-        filename = f"photo_{update.effective_user.id}.jpg"
-        file_path = os.path.join(TEMP_DIR, filename)
-        photo_file.download(file_path)
-        context.user_data['cv_data']['photo_path'] = file_path
-        update.message.reply_text("✅ Photo received. What's your full name?")
-        return NAME
-    except Exception as e:
-        logger.error(f"Photo download failed: {e}")
-        update.message.reply_text("❌ Failed to save photo. Please try again or type /skip")
+    # Downloads the smallest variant large enough for any output and prepares
+    # it once; both the PDF and DOCX embed this file
+    result = photo_handler.handle_photo(update, context)
+    if not result['success']:
+        update.message.reply_text(result['message'])
         return PHOTO
+    cv_data = context.user_data['cv_data']
+    cv_data['photo_path'] = result['file_path']
+    update.message.reply_text("✅ Photo received. What's your full name?")
+    return NAME
 
 def skip_photo(update: Update, context: CallbackContext) -> int:
     """Skip photo upload"""
@@ -387,11 +407,88 @@ def get_phone(update: Update, context: CallbackContext) -> int:
     update.message.reply_text("🧠 Please write a short professional summary about yourself:")
     return SUMMARY
 
+def _live_message(message):
+    """Callback that edits `message` with streamed text, throttled to SUMMARY_EDIT_INTERVAL.
+
+    Intermediate edits are skipped while throttled. The final text always
+    gets through: it is sent from a timer that waits out the interval or
+    Telegram's `retry_after` and retries failed edits, so the caller is
+    never held up. A later final text replaces an earlier one not yet sent.
+    """
+    # `shown` is the exact string on screen, updated only once Telegram accepted the edit
+    state = {'shown': message.text, 'next_at': 0.0, 'final': None, 'attempts': 0}
+    lock = threading.Lock()
+
+    def render(text: str, final: bool) -> str:
+        return f"🧠 {text}" if final else f"🧠 {text}…"
+
+    def edit(text: str, final: bool) -> bool:
+        rendered = render(text, final)
+        try:
+            message.edit_text(rendered)
+        except RetryAfter as e:
+            state['next_at'] = time.monotonic() + e.retry_after
+            return False
+        except BadRequest as e:
+            if 'not modified' not in str(e).lower():
+                logger.debug(f"Streaming edit failed: {e}")
+                state['next_at'] = time.monotonic() + SUMMARY_EDIT_INTERVAL
+                return False
+        except Exception as e:
+            logger.debug(f"Streaming edit failed: {e}")
+            state['next_at'] = time.monotonic() + SUMMARY_EDIT_INTERVAL
+            return False
+        state.update(shown=rendered, next_at=time.monotonic() + SUMMARY_EDIT_INTERVAL)
+        return True
+
+    def schedule_final(delay: float):
+        timer = threading.Timer(max(0.0, delay), edit_final)
+        timer.daemon = True
+        timer.start()
+
+    def edit_final():
+        with lock:
+            text = state['final']
+            # a partial edit of the same text still ends in "…"
+            if render(text, True) == state['shown']:
+                return
+            delay = state['next_at'] - time.monotonic()
+            if delay <= 0:
+                state['attempts'] += 1
+                if edit(text, True):
+                    return
+                if state['attempts'] >= SUMMARY_FINAL_EDIT_ATTEMPTS:
+                    logger.warning("Giving up on the final edit of a streamed message")
+                    return
+                delay = state['next_at'] - time.monotonic()
+            schedule_final(delay)
+
+    def update_text(text: str, final: bool):
+        if final:
+            with lock:
+                state['final'] = text
+                state['attempts'] = 0
+            schedule_final(0.0)
+            return
+        with lock:
+            if (state['final'] is not None or render(text, False) == state['shown']
+                    or time.monotonic() < state['next_at']):
+                return
+            edit(text, False)
+
+    return update_text
+
 def get_summary(update: Update, context: CallbackContext) -> int:
     """Get and enhance professional summary"""
     text = update.message.text.strip()
-    polished = ask_gemini(f"Rewrite this professionally in 3-4 sentences:\n{text}")
-    context.user_data['cv_data']['summary'] = polished or text
+    context.user_data['cv_data']['summary'] = text
+    # Stream the rewrite into a placeholder in the background; the raw text is
+    # kept if the rewrite is late or fails
+    placeholder = update.message.reply_text("✍️ Polishing your summary…")
+    ai_rewriter.rewrite_streaming(
+        context.user_data.setdefault('ai_pending', []), context.user_data['cv_data'], 'summary',
+        f"Rewrite this professionally in 3-4 sentences:\n{text}", _live_message(placeholder)
+    )
     
     if 'editing_field' in context.user_data:
         del context.user_data['editing_field']
@@ -419,14 +516,15 @@ def get_experience(update: Update, context: CallbackContext) -> int:
       
         return EXPERIENCE
     
-    description = ask_gemini(f"Improve this job description professionally:\n{parts[3]}")
     job = {
         'role': parts[0],
         'company': parts[1],
         'years': parts[2] if len(parts) > 2 else "Not specified",
-        'description': description or parts[3]
+        'description': parts[3]
     }
     context.user_data['cv_data']['experience'].append(job)
+    # Polished together with the user's other jobs once the section is done
+    context.user_data.setdefault('ai_deferred', []).append(job)
     
     keyboard = [
         [InlineKeyboardButton("➕ Add Another", callback_data='add_experience')],
@@ -441,6 +539,14 @@ def get_experience(update: Update, context: CallbackContext) -> int:
     )
     return WAITING_CALLBACK
 
+def _polish_experience(context: CallbackContext):
+    """Send the job descriptions collected so far to Gemini as one batched rewrite."""
+    jobs = context.user_data.pop('ai_deferred', [])
+    if jobs:
+        ai_rewriter.polish_batched(
+            context.user_data.setdefault('ai_pending', []), [(job, 'description') for job in jobs]
+        )
+
 def get_education(update: Update, context: CallbackContext) -> int:
     """Add education"""
     text = update.message.text.strip()
@@ -553,28 +659,49 @@ def generate_cv(update: Update, context: CallbackContext) -> int:
             chat_id = update.message.chat_id
 
         data = context.user_data['cv_data']
-        
-        # Generate files
-        pdf_file = generate_pdf(data)
-        docx_file = generate_docx(data)
-        
-        # Send files
-        with open(pdf_file, 'rb') as pdf, open(docx_file, 'rb') as docx:
-            context.bot.send_document(
+        _polish_experience(context)
+        ai_rewriter.wait(context.user_data.setdefault('ai_pending', []))
+
+        # Render in the worker pool so the GIL-heavy layout doesn't stall other users
+        try:
+            job = render_pool.submit(data)
+        except RenderQueueFull:
+            context.bot.send_message(
                 chat_id=chat_id,
-                document=InputFile(pdf),
-                filename=f"{data['name'].replace(' ', '_')}_CV.pdf"
+                text="🚦 We're generating a lot of CVs right now. Please try again in a minute."
             )
-            context.bot.send_document(
+            return review(update, context)
+        if job.position:
+            context.bot.send_message(
                 chat_id=chat_id,
-                document=InputFile(docx),
-                filename=f"{data['name'].replace(' ', '_')}_CV.docx"
+                text=f"⏳ You're in the queue, position {job.position}. Your CV will arrive shortly."
             )
-        
+        # Upload each document as soon as its worker finishes; the other keeps
+        # rendering while this one is in flight to Telegram
+        started = time.perf_counter()
+        generated_files = []
+        try:
+            for kind, payload, render_seconds in job.as_completed():
+                ready_at = time.perf_counter() - started
+                upload_started = time.perf_counter()
+                filename = f"{data['name'].replace(' ', '_')}_CV.{kind}"
+                context.bot.send_document(
+                    chat_id=chat_id,
+                    document=io.BytesIO(payload),
+                    filename=filename
+                )
+                logger.info(
+                    f"CV {kind} for user {user_id}: render {render_seconds:.2f}s, "
+                    f"ready at {ready_at:.2f}s, upload {time.perf_counter() - upload_started:.2f}s"
+                )
+                generated_files.append(filename)
+        except RenderTimeout:
+            logger.error(f"CV render timed out for user {user_id}")
+            raise
+        logger.info(f"CV for user {user_id} delivered in {time.perf_counter() - started:.2f}s")
+
         # Clean up
         try:
-            os.remove(pdf_file)
-            os.remove(docx_file)
             if 'photo_path' in data and data['photo_path'] and os.path.exists(data['photo_path']):
                 os.remove(data['photo_path'])
         except Exception as e:
@@ -590,7 +717,7 @@ def generate_cv(update: Update, context: CallbackContext) -> int:
         )
         # Notify owner about CV generation (best-effort) in background
         try:
-            filenames = [os.path.basename(pdf_file), os.path.basename(docx_file)]
+            filenames = list(generated_files)
             threading.Thread(target=send_cv_generated_email, args=(update.effective_user, filenames), daemon=True).start()
         except Exception:
             logger.exception("Failed to start background CV-generation email thread")
@@ -617,7 +744,13 @@ def callback_handler(update: Update, context: CallbackContext) -> int:
     
     # Handle template selection
     if data.startswith('template_'):
-        template_name = data.split('_')[1]
+        template_name = data.split('_', 1)[1]
+        if template_name not in template_registry:
+            query.edit_message_text(
+                "❗ Unknown template, please choose one of the designs below:",
+                reply_markup=query.message.reply_markup
+            )
+            return SELECT_TEMPLATE
         context.user_data['cv_data']['template'] = template_name
         query.edit_message_text(f"✅ Selected {template_name.replace('_', ' ')} template")
         return generate_cv(update, context)
@@ -634,6 +767,7 @@ def callback_handler(update: Update, context: CallbackContext) -> int:
         return EXPERIENCE
         
     elif data == 'finish_experience':
+        _polish_experience(context)
         query.edit_message_text(
             "🎓 Add your education (Degree - Institution - Years):"
         )
@@ -679,6 +813,7 @@ def callback_handler(update: Update, context: CallbackContext) -> int:
         
     elif data == 'edit_experience':
         context.user_data['cv_data']['experience'] = []
+        context.user_data.pop('ai_deferred', None)
         query.edit_message_text(
             "💼 Let's re-enter your experiences (Role - Company - Years - Description):"
         )
@@ -742,6 +877,8 @@ def callback_handler(update: Update, context: CallbackContext) -> int:
 def review(update: Update, context: CallbackContext) -> int:
     """Show review of all information with edit options"""
     data = context.user_data['cv_data']
+    _polish_experience(context)
+    ai_rewriter.wait(context.user_data.setdefault('ai_pending', []))
     
     text = "📝 <b>Review Your CV</b>\n\n"
     text += f"👤 <b>Name:</b> {data['name']}\n"
@@ -967,6 +1104,88 @@ def admin_list_paid(update: Update, context: CallbackContext):
     update.message.reply_text('\n'.join(users) if users else '(no paid users)')
 
 
+def admin_render_stats(update: Update, context: CallbackContext):
+    if not _is_admin(update):
+        update.message.reply_text('Unauthorized.')
+        return
+    stats = render_pool.cache_stats()
+    pool = render_pool.stats()
+    update.message.reply_text(
+        f"Render pool: {pool['workers']} workers, {pool['pending']} tasks pending, {pool['queued']} queued\n"
+        f"Completed: {pool['completed']} / Failed: {pool['failed']} / Rejected: {pool['rejected']}\n"
+        f"Timeouts: {pool['timeouts']} / Recycles: {pool['recycles']}\n"
+        f"Render cache: {'enabled' if stats['enabled'] else 'disabled'}\n"
+        f"Hits: {stats['hits']} / Misses: {stats['misses']} ({stats['hit_ratio']:.0%})\n"
+        f"Evictions: {stats['evictions']}\n"
+        f"Avg render: {stats['avg_render_seconds']:.2f}s\n"
+        f"Layout time saved: {stats['saved_seconds']:.1f}s"
+    )
+
+
+def admin_db_stats(update: Update, context: CallbackContext):
+    if not _is_admin(update):
+        update.message.reply_text('Unauthorized.')
+        return
+    stats = pg_pool.stats()
+    events = analytics.stats()
+    cv_store = db_stats()
+    update.message.reply_text(
+        f"DB pool: {'open' if stats['open'] else 'not opened'} (min {stats['min']}, max {stats['max']})\n"
+        f"Checkouts: {stats['checkouts']} / Timeouts: {stats['timeouts']}\n"
+        f"Wait: avg {stats['avg_wait_ms']:.1f}ms, max {stats['max_wait_ms']:.1f}ms\n"
+        f"Errors: {stats['errors']} / Reconnects: {stats['reconnects']} / Health checks: {stats['health_checks']}\n"
+        f"Analytics queue: {'enabled' if events['enabled'] else 'disabled'}, "
+        f"{events['depth']}/{events['max_queue']} queued\n"
+        f"Flushed: {events['flushed']} in {events['batches']} batches / Dropped: {events['dropped']} / Failed: {events['failed']}\n"
+        f"Flush: avg {events['avg_flush_ms']:.1f}ms, max {events['max_flush_ms']:.1f}ms\n"
+        f"User upserts: {events['upserts']} / Skipped: {events['upserts_skipped']} / "
+        f"last_seen updates: {events['last_seen_updates']} ({events['user_cache_size']} cached)\n"
+        f"CV store: {cv_store['mode']} for {cv_store['mode_seconds']:.0f}s, {cv_store['pending']} saves pending, "
+        f"{cv_store['readers']} readers\n"
+        f"Fallback switches: {cv_store['fallback_switches']} / Recoveries: {cv_store['recoveries']} / "
+        f"Failed probes: {cv_store['probe_failures']}\n"
+        f"Last migration: {cv_store['migrated_rows']} users in {cv_store['last_migration_seconds']:.3f}s\n"
+        f"CV commits: {cv_store['commits']} ({cv_store['rows_per_commit']:.1f} rows each)\n"
+        f"Fallback store: {cv_store['fallback_records']} records, log {cv_store['fallback_log_bytes']} bytes, "
+        f"{cv_store['fallback_compactions']} compactions"
+    )
+
+
+def admin_ai_stats(update: Update, context: CallbackContext):
+    if not _is_admin(update):
+        update.message.reply_text('Unauthorized.')
+        return
+    parsing = parse_stats.stats()
+    client = gemini_client.stats()
+    rewrites = ai_rewriter.stats()
+    batching = ai_rewriter.batcher.stats()
+    scheduling = ai_scheduler.stats()
+    interactive, bulk = scheduling['interactive'], scheduling['bulk']
+    cache = prompt_cache.stats()
+    update.message.reply_text(
+        f"AI responses parsed: {parsing['responses']}\n"
+        f"Complete: {parsing['parsed']} / Partial: {parsing['partial']} / Failed: {parsing['failed']}\n"
+        f"Avg parse: {parsing['avg_parse_ms']:.2f}ms\n"
+        f"Gemini requests: {client['requests']} / Retries: {client['retries']} / Failures: {client['failures']}\n"
+        f"Avg request: {client['avg_seconds']:.2f}s\n"
+        f"Prompt cache: {'enabled' if cache['enabled'] else 'disabled'}, "
+        f"{cache['hits']} hits / {cache['misses']} misses ({cache['hit_ratio']:.0%})\n"
+        f"Cache evictions: {cache['evictions']} / Latency saved: {cache['saved_seconds']:.1f}s\n"
+        f"Background rewrites: {rewrites['submitted']} / Applied: {rewrites['applied']} / "
+        f"Discarded: {rewrites['discarded']} ({rewrites['abandoned']} abandoned at a deadline)\n"
+        f"Review waits: {rewrites['waits']} (avg {rewrites['avg_wait_seconds']:.2f}s, {rewrites['timeouts']} past deadline)\n"
+        f"Batched descriptions: {batching['items']} in {batching['calls']} calls "
+        f"({batching['calls_saved']} saved, {batching['fallbacks']} fallbacks, "
+        f"{batching['cache_hits']} served from cache)\n"
+        f"Scheduler: {scheduling['in_flight']} in flight, {scheduling['waiting']} waiting, "
+        f"{scheduling['tokens']:.1f} tokens\n"
+        f"Interactive: {interactive['admitted']} admitted / {interactive['rejected']} skipped, "
+        f"wait avg {interactive['avg_wait_ms']:.0f}ms, max {interactive['max_wait_ms']:.0f}ms\n"
+        f"Bulk: {bulk['admitted']} admitted / {bulk['rejected']} skipped, "
+        f"wait avg {bulk['avg_wait_ms']:.0f}ms, max {bulk['max_wait_ms']:.0f}ms"
+    )
+
+
 def help_handler(update: Update, context: CallbackContext):
     text = (
         "Available commands:\n"
@@ -985,6 +1204,9 @@ def help_handler(update: Update, context: CallbackContext):
                 "/mark_paid <user_id>\n"
                 "/mark_unpaid <user_id>\n"
                 "/list_paid\n"
+                "/render_stats\n"
+                "/db_stats\n"
+                "/ai_stats\n"
             )
             update.message.reply_text(admin_text)
     except Exception:
@@ -1000,7 +1222,14 @@ def error_handler(update: Update, context: CallbackContext):
 
 def main():
     """Start the bot"""
-    updater = Updater(TELEGRAM_TOKEN)
+    template_registry.warm()
+    # Fork the render workers before the bot starts its own threads or
+    # opens database connections
+    render_pool.start()
+    analytics.start()
+    # Template selection blocks on the render pool, so leave room for every
+    # queued job to wait without starving other updates
+    updater = Updater(TELEGRAM_TOKEN, workers=max(4, render_pool.max_workers + render_pool.max_queue))
     dp = updater.dispatcher
     dp.add_handler(feedback_conversation)
     # Add social links handlers
@@ -1028,6 +1257,9 @@ def main():
     dp.add_handler(CommandHandler('mark_paid', admin_mark_paid))
     dp.add_handler(CommandHandler('mark_unpaid', admin_mark_unpaid))
     dp.add_handler(CommandHandler('list_paid', admin_list_paid))
+    dp.add_handler(CommandHandler('render_stats', admin_render_stats))
+    dp.add_handler(CommandHandler('db_stats', admin_db_stats))
+    dp.add_handler(CommandHandler('ai_stats', admin_ai_stats))
     # Help command (shows admin commands to admin only)
     dp.add_handler(CommandHandler('help', lambda u, c: help_handler(u, c)))
     conv_handler = ConversationHandler(
@@ -1048,7 +1280,7 @@ def main():
             PROJECTS: [MessageHandler(Filters.text & ~Filters.command, get_projects)],
             WAITING_CALLBACK: [CallbackQueryHandler(callback_handler)],
             REVIEW: [MessageHandler(Filters.text & ~Filters.command, review)],
-            SELECT_TEMPLATE: [CallbackQueryHandler(callback_handler)],
+            SELECT_TEMPLATE: [CallbackQueryHandler(callback_handler, run_async=True)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
         allow_reentry=True
@@ -1072,6 +1304,13 @@ def main():
         logger.info("Polling server started in development mode")
 
     updater.idle()
+    render_pool.shutdown()
+    ai_rewriter.shutdown()
+    # Flush queued analytics events before the pool goes away
+    analytics.close()
+    pg_pool.close()
+    # Commit queued CV saves and checkpoint the SQLite WAL
+    close_db()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -2,17 +2,37 @@
 
 Attempts to use SQLite; if the DB is unavailable (disk full, too many connections,
 corruption, etc.) the module falls back to an in-memory dict persisted to
-a JSON file under `temp/` so the application can continue operating.
+an append-only JSON log under `temp/` (see `fallback_store`) so the
+application can continue operating. Records left there by an earlier run
+are moved back into SQLite at startup, and while in fallback mode a probe
+thread retries SQLite and migrates them back as soon as it is usable again.
+
+The SQLite database runs in WAL mode with `synchronous=NORMAL`. Each thread
+reads through its own connection, so loads never queue behind a commit.
+Saves are write-behind: they are queued and a background writer commits
+many users' saves in one transaction. Saves still waiting for that commit
+are served from memory, so a load always sees the latest save. `close`
+flushes the queue and checkpoints the WAL before exit; saves that arrive
+after it are committed directly instead of restarting the writer.
+
+The module-level wrapper is created on first use, so importing this module
+(e.g. for `DBWrapper` in a benchmark) does not touch `cv_bot.db`.
 """
 
+import ast
+import atexit
 from datetime import datetime
 import json
 import os
 import sqlite3
 import threading
-from typing import Dict, Optional
+import time
+from typing import Dict, List, Optional, Tuple
 import logging
 
+from event_queue import BatchQueue
+from fallback_store import FallbackStore
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMP_DIR = os.path.join(BASE_DIR, 'temp')
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
@@ -26,15 +46,66 @@ FALLBACK_FILE = os.path.join(TEMP_DIR, "cv_fallback.json")
 logger = logging.getLogger(__name__)
 
 
+def _env_int(name: str, default: int) -> int:
+    val = os.getenv(name)
+    try:
+        return int(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
 class DBWrapper:
-    def __init__(self):
+    def __init__(self, db_path: str = DB_PATH, fallback_file: str = FALLBACK_FILE, write_behind: bool = True,
+                 batch_size: int = 100, flush_interval: float = 0.05, probe_interval: float = 30.0):
+        self.db_path = db_path
+        self.fallback_file = fallback_file
         self._lock = threading.RLock()
+        # held while using the write connection; always taken before `_lock`
+        self._write_lock = threading.RLock()
         self._mode = "sqlite"
         self._conn = None
-        self._fallback: Dict[str, Dict] = {}
+        self._fallback = FallbackStore(
+            fallback_file,
+            fsync_every=_env_int('FALLBACK_FSYNC_EVERY', 16),
+            fsync_interval=_env_int('FALLBACK_FSYNC_MS', 1000) / 1000,
+            compact_bytes=_env_int('FALLBACK_COMPACT_KB', 1024) * 1024,
+        )
+        # per-thread read connections; all of them are kept so they can be closed
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        # user_id -> (JSON, last_updated) saved but not yet committed
+        self._pending: Dict[int, Tuple[str, str]] = {}
+        self._queue = BatchQueue(
+            self._write_batch, name='cv saves', batch_size=batch_size, flush_interval=flush_interval
+        ) if write_behind else None
+        self._commits = 0
+        self._rows_written = 0
+        # recovery from fallback mode: a probe thread retries SQLite every `probe_interval` seconds
+        self.probe_interval = probe_interval
+        self._probe_thread: Optional[threading.Thread] = None
+        self._closing = threading.Event()
+        self._fallback_switches = 0
+        self._recoveries = 0
+        self._probe_failures = 0
+        self._migrated_rows = 0
+        self._last_migration_seconds = 0.0
+        self._mode_since = time.time()
+        atexit.register(self.close)
         try:
-            self._conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=5)
-            c = self._conn.cursor()
+            self._conn = self._open_sqlite()
+            self._restore_fallback()
+            logger.info("Using sqlite DB at %s", db_path)
+        except Exception as e:
+            logger.exception("SQLite unavailable, switching to fallback: %s", e)
+            self._switch_to_fallback()
+
+    def _open_sqlite(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            c = conn.cursor()
             c.execute(
                 """
                 CREATE TABLE IF NOT EXISTS users (
@@ -44,14 +115,33 @@ class DBWrapper:
                 )
                 """
             )
-            self._conn.commit()
-            logger.info("Using sqlite DB at %s", DB_PATH)
-        except Exception as e:
-            logger.exception("SQLite unavailable, switching to fallback: %s", e)
-            self._switch_to_fallback()
+            conn.commit()
+        except Exception:
+            conn.close()
+            raise
+        return conn
 
-    def _switch_to_fallback(self):
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=5)
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+
+    def _close_readers(self):
         with self._lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    def _switch_to_fallback(self):
+        with self._write_lock, self._lock:
             try:
                 if self._conn:
                     try:
@@ -59,90 +149,321 @@ class DBWrapper:
                     except Exception:
                         pass
                     self._conn = None
+                self._close_readers()
             finally:
                 self._mode = "fallback"
-                # load existing fallback file if present
+                self._fallback_switches += 1
+                self._mode_since = time.time()
+                # replay the existing fallback snapshot and log, if any
                 try:
-                    if os.path.exists(FALLBACK_FILE):
-                        with open(FALLBACK_FILE, "r", encoding="utf-8") as f:
-                            self._fallback = json.load(f)
-                    else:
-                        self._fallback = {}
+                    self._fallback.load()
                 except Exception:
-                    logger.exception("Failed to load fallback file; starting fresh")
-                    self._fallback = {}
+                    logger.exception("Failed to load fallback store; starting fresh")
+                # saves that never reached SQLite must not be lost
+                for user_id, (raw, last_updated) in self._pending.items():
+                    try:
+                        self._fallback.put(str(user_id), json.loads(raw), last_updated)
+                    except Exception:
+                        logger.exception("Failed to move pending save of %s to the fallback store", user_id)
+                self._pending.clear()
+                self._start_probe()
+
+    def _start_probe(self):
+        if self.probe_interval <= 0 or self._closing.is_set():
+            return
+        if self._probe_thread is None or not self._probe_thread.is_alive():
+            self._probe_thread = threading.Thread(target=self._probe_loop, name='sqlite-probe', daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        while not self._closing.wait(self.probe_interval):
+            if self._mode != "fallback" or self._try_recover():
+                return
+
+    def _try_recover(self) -> bool:
+        """Reopen SQLite, move the fallback records into it and switch back to sqlite mode."""
+        # both locks: no save or load may run against the fallback store while it is migrated
+        with self._write_lock, self._lock:
+            if self._mode != "fallback":
+                return True
+            try:
+                conn = self._open_sqlite()
+            except Exception as e:
+                self._probe_failures += 1
+                logger.debug("SQLite still unavailable: %s", e)
+                return False
+            try:
+                self._probe_write(conn)
+            except Exception as e:
+                conn.close()
+                self._probe_failures += 1
+                logger.debug("SQLite opens but still rejects writes: %s", e)
+                return False
+            previous, self._conn = self._conn, conn
+            try:
+                self._migrate_fallback()
+            except Exception as e:
+                self._conn = previous
+                conn.close()
+                self._probe_failures += 1
+                logger.warning("SQLite reopened but migrating the fallback store failed: %s", e)
+                return False
+            self._mode = "sqlite"
+            self._recoveries += 1
+            self._mode_since = time.time()
+        logger.info("SQLite recovered; migrated %s users in %.3fs", self._migrated_rows, self._last_migration_seconds)
+        return True
+
+    @staticmethod
+    def _probe_write(conn: sqlite3.Connection):
+        """Take the write lock and write a row, then roll back; raises if SQLite can't take writes.
+
+        Opening the database and creating the table can succeed on a disk that
+        is full or read-only, so recovery only counts once a write goes through.
+        """
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR REPLACE INTO users (user_id, data, last_updated) VALUES (-1, '{}', '')")
+        finally:
+            conn.rollback()
+
+    def _migrate_fallback(self):
+        """Write every fallback record to SQLite in one transaction, then clear the store."""
+        started = time.perf_counter()
+        rows = list(self._fallback.rows())
+        if rows:
+            with self._write_lock:
+                # a stale snapshot (e.g. a legacy cv_fallback.json) must not
+                # overwrite rows SQLite has saved since
+                self._commit_rows(rows, newer_only=True)
+        self._fallback.clear()
+        self._migrated_rows = len(rows)
+        self._last_migration_seconds = time.perf_counter() - started
+
+    def _restore_fallback(self):
+        """Move records a previous run left in the fallback store into SQLite."""
+        if not self._fallback.exists():
+            return
+        self._fallback.load()
+        self._migrate_fallback()
+        if self._migrated_rows:
+            logger.info("Restored %s users from the fallback store into SQLite", self._migrated_rows)
+
+    def _commit_rows(self, rows: List[Tuple[int, str, str]], newer_only: bool = False):
+        c = self._conn.cursor()
+        if newer_only:
+            c.executemany(
+                """
+                INSERT INTO users (user_id, data, last_updated) VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, last_updated = excluded.last_updated
+                WHERE users.last_updated IS NULL OR excluded.last_updated > users.last_updated
+                """,
+                rows,
+            )
+        else:
+            c.executemany("INSERT OR REPLACE INTO users (user_id, data, last_updated) VALUES (?, ?, ?)", rows)
+        self._conn.commit()
+        self._commits += 1
+        self._rows_written += len(rows)
+
+    def _write_batch(self, user_ids: List[int]):
+        """Commit the latest pending save of every user in `user_ids` in one transaction."""
+        with self._write_lock:
+            with self._lock:
+                if self._mode != "sqlite":
+                    return
+                # a user saved twice in the batch is written once, with the newest data
+                rows = {uid: self._pending[uid] for uid in user_ids if uid in self._pending}
+            if not rows:
+                return
+            try:
+                self._commit_rows([(uid, raw, ts) for uid, (raw, ts) in rows.items()])
+            except Exception:
+                logger.exception("SQLite batch write failed; switching to fallback")
+                self._switch_to_fallback()
+                return
+            with self._lock:
+                for uid, row in rows.items():
+                    # keep entries saved again since this batch was collected
+                    if self._pending.get(uid) is row:
+                        del self._pending[uid]
 
     def save_user_data(self, user_id: int, data: Dict):
-        with self._lock:
-            if self._mode == "sqlite":
-                try:
-                    c = self._conn.cursor()
-                    # store as JSON to be robust
-                    c.execute(
-                        "INSERT OR REPLACE INTO users (user_id, data, last_updated) VALUES (?, ?, ?)",
-                        (user_id, json.dumps(data), datetime.now().isoformat()),
-                    )
-                    self._conn.commit()
+        # store as JSON to be robust
+        raw = json.dumps(data)
+        last_updated = datetime.now().isoformat()
+        if self._mode == "sqlite":
+            direct = self._queue is None
+            if not direct:
+                # under the lock `close` sets `_closing` with, so a save either
+                # reaches the queue before it is stopped or skips it entirely
+                with self._lock:
+                    queued = self._mode == "sqlite" and not self._closing.is_set()
+                    direct = self._mode == "sqlite" and not queued
+                    if queued:
+                        self._pending[user_id] = (raw, last_updated)
+                        self._queue.start()
+                        accepted = self._queue.put(user_id)
+                if queued:
+                    if not accepted:
+                        # queue full: commit this save ourselves rather than drop it
+                        self._write_batch([user_id])
                     return True
+            if direct:
+                try:
+                    with self._write_lock:
+                        if self._mode == "sqlite":
+                            if self._conn is None and self._closing.is_set():
+                                # saved after close(), which released the write connection
+                                self._conn = self._open_sqlite()
+                            self._commit_rows([(user_id, raw, last_updated)])
+                            return True
                 except Exception:
                     logger.exception("SQLite write failed; switching to fallback")
                     self._switch_to_fallback()
                     # fall through to fallback write
 
-            # Fallback mode
+        # Fallback mode
+        with self._lock:
+            recovered = self._mode == "sqlite"
+            if not recovered:
+                try:
+                    self._fallback.put(str(user_id), data, last_updated)
+                    return True
+                except Exception:
+                    logger.exception("Failed to write fallback store")
+                    return False
+        # SQLite came back while this save was switching over
+        return self.save_user_data(user_id, data)
+
+    def load_user_data(self, user_id: int) -> Optional[Dict]:
+        if self._mode == "sqlite":
+            pending = self._pending.get(user_id)
+            if pending is not None:
+                return json.loads(pending[0])
             try:
-                key = str(user_id)
-                self._fallback[key] = {"data": data, "last_updated": datetime.now().isoformat()}
-                with open(FALLBACK_FILE, "w", encoding="utf-8") as f:
-                    json.dump(self._fallback, f)
-                return True
+                c = self._reader().cursor()
+                c.execute("SELECT data FROM users WHERE user_id=?", (user_id,))
+                row = c.fetchone()
+                if row and row[0]:
+                    raw = row[0]
+                    # try JSON first, then a Python literal for legacy repr() rows
+                    try:
+                        return json.loads(raw)
+                    except Exception:
+                        try:
+                            return ast.literal_eval(raw)
+                        except Exception:
+                            logger.exception("Failed to parse stored user data")
+                            return None
+                return None
             except Exception:
-                logger.exception("Failed to write fallback file")
-                return False
+                logger.exception("SQLite read failed; switching to fallback")
+                self._switch_to_fallback()
+                # fall through to fallback read
 
-    def load_user_data(self, user_id: int) -> Optional[Dict]:
+        # Fallback mode
         with self._lock:
-            if self._mode == "sqlite":
+            recovered = self._mode == "sqlite"
+            if not recovered:
                 try:
-                    c = self._conn.cursor()
-                    c.execute("SELECT data FROM users WHERE user_id=?", (user_id,))
-                    row = c.fetchone()
-                    if row and row[0]:
-                        raw = row[0]
-                        # try JSON first, then eval as a last resort for legacy rows
-                        try:
-                            return json.loads(raw)
-                        except Exception:
-                            try:
-                                return eval(raw)
-                            except Exception:
-                                logger.exception("Failed to parse stored user data")
-                                return None
+                    key = str(user_id)
+                    rec = self._fallback.get(key)
+                    if rec:
+                        return rec.get("data")
                     return None
                 except Exception:
-                    logger.exception("SQLite read failed; switching to fallback")
-                    self._switch_to_fallback()
-                    # fall through to fallback read
+                    logger.exception("Failed to read fallback data")
+                    return None
+        return self.load_user_data(user_id)
 
-            # Fallback mode
-            try:
-                key = str(user_id)
-                rec = self._fallback.get(key)
-                if rec:
-                    return rec.get("data")
-                return None
-            except Exception:
-                logger.exception("Failed to read fallback data")
-                return None
+    def flush(self):
+        """Commit every queued save now."""
+        with self._lock:
+            user_ids = list(self._pending)
+        if user_ids:
+            self._write_batch(user_ids)
 
+    def close(self):
+        """Flush queued saves, checkpoint the WAL and close all connections.
 
-# single module-level wrapper used by other modules
-_db = DBWrapper()
+        Later saves still work; they are committed synchronously.
+        """
+        with self._lock:
+            self._closing.set()
+        if self._queue is not None:
+            self._queue.stop()
+        self.flush()
+        self._close_readers()
+        self._fallback.close()
+        with self._write_lock:
+            if self._conn is not None:
+                try:
+                    self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                except Exception:
+                    logger.exception("WAL checkpoint failed")
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {
+                'mode': self._mode,
+                'pending': len(self._pending),
+                'readers': len(self._readers),
+                'commits': self._commits,
+                'rows_written': self._rows_written,
+                'rows_per_commit': (self._rows_written / self._commits) if self._commits else 0.0,
+            }
+        with self._lock:
+            stats.update(
+                mode_seconds=time.time() - self._mode_since,
+                fallback_switches=self._fallback_switches,
+                recoveries=self._recoveries,
+                probe_failures=self._probe_failures,
+                migrated_rows=self._migrated_rows,
+                last_migration_seconds=self._last_migration_seconds,
+            )
+        fallback = self._fallback.stats()
+        stats.update(fallback_records=fallback['records'], fallback_log_bytes=fallback['log_bytes'],
+                     fallback_compactions=fallback['compactions'])
+        if self._queue is not None:
+            queue = self._queue.stats()
+            stats.update(queued=queue['depth'], avg_flush_ms=queue['avg_flush_ms'], max_flush_ms=queue['max_flush_ms'])
+        return stats
+
+
+# single module-level wrapper used by other modules, created on first use
+_db: Optional[DBWrapper] = None
+_db_lock = threading.Lock()
+
+
+def _get_db() -> DBWrapper:
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = DBWrapper(
+                    write_behind=os.getenv('DB_WRITE_BEHIND', '1').strip().lower() not in ('0', 'false', 'no'),
+                    batch_size=_env_int('DB_WRITE_BATCH_SIZE', 100),
+                    flush_interval=_env_int('DB_WRITE_FLUSH_MS', 50) / 1000,
+                    probe_interval=_env_int('DB_RECOVERY_PROBE_SECONDS', 30),
+                )
+    return _db
 
 
 def save_user_data(user_id: int, data: Dict):
-    return _db.save_user_data(user_id, data)
+    return _get_db().save_user_data(user_id, data)
 
 
 def load_user_data(user_id: int) -> Optional[Dict]:
-    return _db.load_user_data(user_id)
+    return _get_db().load_user_data(user_id)
+
+
+def close():
+    if _db is not None:
+        _db.close()
+
+
+def stats() -> Dict:
+    return _get_db().stats()
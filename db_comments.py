@@ -1,27 +1,23 @@
-import psycopg2
 from datetime import datetime
-import os
 from dotenv import load_dotenv
 
+from pg_pool import pg_pool
+
 load_dotenv()
 
 def connect_db():
-    return psycopg2.connect(os.getenv("DATABASE_URL"))
+    """Borrow a pooled connection; use as a context manager"""
+    return pg_pool.connection()
 
 def save_user_comment(user_id: int, username: str, comment: str):
     try:
-        conn = connect_db()
-        cursor = conn.cursor()
-
         timestamp = datetime.now()
-        cursor.execute("""
-            INSERT INTO comments (user_id, username, comment, timestamp)
-            VALUES (%s, %s, %s, %s)
-        """, (user_id, username, comment, timestamp))
+        with pg_pool.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO comments (user_id, username, comment, timestamp)
+                VALUES (%s, %s, %s, %s)
+            """, (user_id, username, comment, timestamp))
 
-        conn.commit()
-        cursor.close()
-        conn.close()
         print("✅ Comment saved to database.")
     except Exception as e:
         print("❌ Error saving comment:", e)
@@ -0,0 +1,141 @@
+"""Bounded in-process queue drained in batches by a background thread.
+
+Handlers call `put` and return immediately; a daemon writer thread collects
+events until it has `batch_size` of them or `flush_interval` seconds have
+passed since the first one arrived, then hands the whole batch to the
+`flush` callback. When the queue is full new events are dropped and counted
+rather than blocking the caller. `stop` drains whatever is still queued.
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BatchQueue:
+    def __init__(self, flush: Callable[[List[Any]], None], name: str = 'events', max_queue: int = 10000,
+                 batch_size: int = 200, flush_interval: float = 0.5):
+        self.flush = flush
+        self.name = name
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: 'queue.Queue[Any]' = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._enqueued = 0
+        self._dropped = 0
+        self._flushed = 0
+        self._failed = 0
+        self._batches = 0
+        self._flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-writer', daemon=True)
+            self._thread.start()
+
+    def put(self, event: Any) -> bool:
+        """Queue an event without blocking; returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            logger.warning("%s queue full (%s), dropping event", self.name, self.max_queue)
+            return False
+        with self._lock:
+            self._enqueued += 1
+        return True
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch: List[Any] = []
+            first = self._queue.get()
+            if first is _STOP:
+                stopping = True
+            else:
+                batch.append(first)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        event = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if event is _STOP:
+                        stopping = True
+                        break
+                    batch.append(event)
+            if stopping:
+                # drain everything queued before stop() was called
+                while True:
+                    try:
+                        event = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if event is not _STOP:
+                        batch.append(event)
+            for start in range(0, len(batch), self.batch_size):
+                self._flush_batch(batch[start:start + self.batch_size])
+
+    def _flush_batch(self, batch: List[Any]):
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            self.flush(batch)
+        except Exception as e:
+            with self._lock:
+                self._failed += len(batch)
+            logger.error("Failed to flush %s %s: %s", len(batch), self.name, e, exc_info=True)
+            return
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._flushed += len(batch)
+            self._batches += 1
+            self._flush_seconds += elapsed
+            self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+
+    def stop(self, timeout: float = 10.0):
+        """Flush pending events and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        started = time.monotonic()
+        try:
+            # wait for room: the sentinel must get in even if the queue is full
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("%s writer did not make room for the stop signal within %ss", self.name, timeout)
+            return
+        thread.join(max(0.0, timeout - (time.monotonic() - started)))
+        if thread.is_alive():
+            logger.warning("%s writer did not finish flushing within %ss", self.name, timeout)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'depth': self._queue.qsize(),
+                'max_queue': self.max_queue,
+                'enqueued': self._enqueued,
+                'flushed': self._flushed,
+                'dropped': self._dropped,
+                'failed': self._failed,
+                'batches': self._batches,
+                'avg_flush_ms': (self._flush_seconds / self._batches * 1000) if self._batches else 0.0,
+                'max_flush_ms': self._max_flush_seconds * 1000,
+            }
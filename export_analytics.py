@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Stream an analytics table to NDJSON, CSV or Parquet for offline analysis.
+
+Rows are read through a named (server-side) cursor in key order, so memory
+use stays flat however large the table is. A checkpoint next to the output
+records the last exported key after every batch; `--resume` continues from
+it after an interrupted run.
+
+Usage examples:
+  python export_analytics.py user_actions -o actions.ndjson
+  python export_analytics.py user_actions -f csv -o actions.csv --since 2026-01-01 --until 2026-02-01
+  python export_analytics.py user_actions -f parquet -o actions_parquet --resume
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from pg_pool import pg_pool
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# table -> (ordered unique key used for resuming, time column for --since/--until)
+TABLES = {
+    'user_actions': ('id', 'timestamp'),
+    'user_sessions': ('id', 'session_start'),
+    'user_feedback': ('id', 'timestamp'),
+    'comments': ('id', 'timestamp'),
+    'users': ('user_id', 'last_seen'),
+}
+
+FORMATS = ('ndjson', 'csv', 'parquet')
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class _TextWriter:
+    """NDJSON/CSV file appended batch by batch; the checkpoint stores its byte offset."""
+
+    def __init__(self, path: str, fmt: str, columns: List[str], offset: Optional[int]):
+        self.fmt = fmt
+        self.columns = columns
+        if path == '-':
+            self.f = sys.stdout
+            self.seekable = False
+        else:
+            resuming = offset is not None
+            if resuming and not os.path.exists(path):
+                raise SystemExit(f"Cannot resume: {path} is missing; rerun without --resume")
+            self.f = open(path, 'r+' if resuming else 'w', encoding='utf-8', newline='')
+            if resuming:
+                # drop anything written after the last checkpoint
+                self.f.seek(offset)
+                self.f.truncate()
+            self.seekable = True
+        self.csv = csv.writer(self.f) if fmt == 'csv' else None
+        # a resumed export already has its header, wherever the checkpoint left off
+        if self.csv is not None and offset is None:
+            self.csv.writerow(columns)
+
+    def write(self, rows: List[tuple]):
+        if self.csv is not None:
+            self.csv.writerows(
+                [json.dumps(v) if isinstance(v, (dict, list)) else v for v in row] for row in rows
+            )
+        else:
+            for row in rows:
+                self.f.write(json.dumps(dict(zip(self.columns, row)), default=_json_value) + '\n')
+
+    def position(self) -> Dict:
+        self.f.flush()
+        if not self.seekable:
+            return {}
+        os.fsync(self.f.fileno())
+        return {'offset': self.f.tell()}
+
+    def close(self):
+        if self.f is not sys.stdout:
+            self.f.close()
+
+
+class _ParquetWriter:
+    """Directory of Parquet part files, one per batch, all with the same schema.
+
+    The schema comes from the result's column types rather than each batch's
+    values, so a batch where a column is all NULL does not give that part
+    file a different type.
+    """
+
+    def __init__(self, path: str, description, part: Optional[int]):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError(f"Parquet export needs pyarrow (pip install pyarrow): {e}")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.columns = [d[0] for d in description]
+        self.schema = pyarrow.schema([(d[0], self._arrow_type(d[1])) for d in description])
+        self.part = part or 0
+        os.makedirs(path, exist_ok=True)
+
+    def _arrow_type(self, type_code: int):
+        pa = self.pa
+        types = {
+            16: pa.bool_(), 20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+            700: pa.float32(), 701: pa.float64(), 1082: pa.date32(),
+            1114: pa.timestamp('us'), 1184: pa.timestamp('us', tz='UTC'),
+        }
+        # text, JSON and anything unlisted are written as strings
+        return types.get(type_code, pa.string())
+
+    def write(self, rows: List[tuple]):
+        data = {}
+        for field, values in zip(self.schema, zip(*rows)):
+            if self.pa.types.is_string(field.type):
+                values = [None if v is None else json.dumps(v) if isinstance(v, (dict, list)) else str(v)
+                          for v in values]
+            data[field.name] = list(values)
+        self.part += 1
+        self.pq.write_table(self.pa.table(data, schema=self.schema),
+                            os.path.join(self.path, f"part-{self.part:05d}.parquet"))
+
+    def position(self) -> Dict:
+        return {'part': self.part}
+
+    def close(self):
+        pass
+
+
+def _load_checkpoint(path: str, table: str, fmt: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('table') != table or checkpoint.get('format') != fmt:
+        raise SystemExit(f"Checkpoint {path} is for {checkpoint.get('table')}/{checkpoint.get('format')}")
+    return checkpoint
+
+
+def _save_checkpoint(path: str, checkpoint: Dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, default=_json_value)
+    os.replace(tmp, path)
+
+
+def export(table: str, fmt: str, output: str, since: Optional[datetime] = None,
+           until: Optional[datetime] = None, resume: bool = False, batch_size: int = 5000,
+           checkpoint_path: Optional[str] = None) -> Dict:
+    """Stream `table` to `output` and return the row count and throughput."""
+    key, time_col = TABLES[table]
+    use_checkpoint = output != '-'
+    checkpoint_path = checkpoint_path or f"{output.rstrip(os.sep)}.checkpoint.json"
+    checkpoint = _load_checkpoint(checkpoint_path, table, fmt) if resume and use_checkpoint else None
+    if checkpoint:
+        since = datetime.fromisoformat(checkpoint['since']) if checkpoint.get('since') else None
+        until = datetime.fromisoformat(checkpoint['until']) if checkpoint.get('until') else None
+        logger.info("Resuming %s export after %s=%s (%s rows done)", table, key, checkpoint['last_key'],
+                    checkpoint['rows'])
+
+    conditions, params = [], []
+    if checkpoint:
+        conditions.append(f"{key} > %s")
+        params.append(checkpoint['last_key'])
+    if since:
+        conditions.append(f"{time_col} >= %s")
+        params.append(since)
+    if until:
+        conditions.append(f"{time_col} < %s")
+        params.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+    rows_done = checkpoint['rows'] if checkpoint else 0
+    exported = 0
+    started = time.perf_counter()
+    with pg_pool.connection() as conn:
+        # named cursor: rows stay on the server and arrive `itersize` at a time
+        with conn.cursor(name=f'export_{table}') as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(f"SELECT * FROM {table} {where} ORDER BY {key}", params)
+            batch = cursor.fetchmany(batch_size)
+            columns = [d[0] for d in cursor.description]
+            key_index = columns.index(key)
+            if fmt == 'parquet':
+                writer = _ParquetWriter(output, cursor.description, checkpoint.get('part') if checkpoint else None)
+            else:
+                writer = _TextWriter(output, fmt, columns, checkpoint.get('offset') if checkpoint else None)
+            try:
+                while batch:
+                    writer.write(batch)
+                    exported += len(batch)
+                    if use_checkpoint:
+                        _save_checkpoint(checkpoint_path, dict(
+                            writer.position(), table=table, format=fmt, last_key=batch[-1][key_index],
+                            rows=rows_done + exported, since=since, until=until,
+                        ))
+                    elapsed = time.perf_counter() - started
+                    logger.info("%s rows exported (%.0f rows/s)", rows_done + exported, exported / elapsed)
+                    batch = cursor.fetchmany(batch_size)
+            finally:
+                writer.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        'table': table,
+        'rows': rows_done + exported,
+        'exported': exported,
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(exported / elapsed) if elapsed else 0,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description='Stream an analytics table to a file.')
+    p.add_argument('table', choices=sorted(TABLES))
+    p.add_argument('-f', '--format', choices=FORMATS, default='ndjson')
+    p.add_argument('-o', '--output', default='-',
+                   help="output file ('-' for stdout), or a directory for parquet")
+    p.add_argument('--since', type=datetime.fromisoformat, help='only rows at or after this time (ISO format)')
+    p.add_argument('--until', type=datetime.fromisoformat, help='only rows before this time (ISO format)')
+    p.add_argument('--resume', action='store_true', help='continue from the checkpoint of an interrupted run')
+    p.add_argument('--batch-size', type=int, default=5000)
+    args = p.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(message)s')
+    if args.format == 'parquet' and args.output == '-':
+        p.error('parquet export needs --output')
+    result = export(args.table, args.format, args.output, args.since, args.until, args.resume, args.batch_size)
+    print(json.dumps(result), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
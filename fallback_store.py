@@ -0,0 +1,218 @@
+"""Append-only JSON store used by `db.DBWrapper` while SQLite is unavailable.
+
+Rewriting the whole fallback file on every save cost O(users) per write, and
+a crash mid-write could leave it truncated. Each save is now one JSON line
+appended to `cv_fallback.log`; loading reads the last snapshot
+(`cv_fallback.json`, the format the old store wrote) and replays the log on
+top of it. A background thread fsyncs the log every `fsync_interval`
+seconds (or every `fsync_every` writes) and compacts it into a new snapshot
+once it grows past `compact_bytes`. Compaction first moves the log aside, so
+appends continue into a fresh log while the snapshot is written, and a crash
+at any point leaves a replayable set of files.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FallbackStore:
+    def __init__(self, snapshot_path: str, fsync_every: int = 16, fsync_interval: float = 1.0,
+                 compact_bytes: int = 1024 * 1024):
+        self.snapshot_path = snapshot_path
+        self.log_path = f"{os.path.splitext(snapshot_path)[0]}.log"
+        # log moved aside by an interrupted compaction; replayed before the live log
+        self.compacting_path = f"{self.log_path}.compacting"
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self._lock = threading.RLock()
+        self._records: Dict[str, Dict] = {}
+        self._log = None
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._appends = 0
+        self._fsyncs = 0
+        self._compactions = 0
+        self._replayed = 0
+
+    def exists(self) -> bool:
+        """Whether a snapshot or log is on disk."""
+        return any(os.path.exists(p) for p in (self.snapshot_path, self.compacting_path, self.log_path))
+
+    def _replay(self, path: str) -> int:
+        lines = 0
+        good_bytes = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # a torn final line from a crash mid-append
+                    logger.warning("Dropping incomplete last line of %s", path)
+                    break
+                good_bytes += len(line)
+                try:
+                    entry = json.loads(line)
+                    self._records[entry['user_id']] = {'data': entry['data'], 'last_updated': entry['last_updated']}
+                except (ValueError, KeyError, TypeError):
+                    logger.warning("Skipping unreadable line in %s", path)
+                    continue
+                lines += 1
+        if good_bytes != os.path.getsize(path):
+            # later appends must start on a fresh line
+            with open(path, 'r+b') as f:
+                f.truncate(good_bytes)
+        return lines
+
+    def load(self):
+        """Read the snapshot and replay the log on top of it."""
+        with self._lock:
+            self._records = {}
+            if os.path.exists(self.snapshot_path):
+                try:
+                    with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                        self._records = json.load(f)
+                except Exception:
+                    logger.exception("Failed to load fallback snapshot; replaying the log only")
+                    self._records = {}
+            self._replayed = 0
+            for path in (self.compacting_path, self.log_path):
+                if os.path.exists(path):
+                    self._replayed += self._replay(path)
+            self._start()
+
+    def _start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='fallback-store', daemon=True)
+            self._thread.start()
+
+    def _open_log(self):
+        if self._log is None:
+            self._log = open(self.log_path, 'a', encoding='utf-8')
+        return self._log
+
+    def _fsync(self):
+        if self._log is not None and self._unsynced:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._unsynced = 0
+            self._fsyncs += 1
+        self._synced_at = time.monotonic()
+
+    def put(self, key: str, data: Dict, last_updated: str):
+        line = json.dumps({'user_id': key, 'data': data, 'last_updated': last_updated}) + '\n'
+        with self._lock:
+            log = self._open_log()
+            log.write(line)
+            log.flush()
+            self._records[key] = {'data': data, 'last_updated': last_updated}
+            self._appends += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._synced_at >= self.fsync_interval:
+                self._fsync()
+            if log.tell() >= self.compact_bytes:
+                self._wake.set()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            return self._records.get(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._records)
+
+    def rows(self) -> Iterator[Tuple[int, str, str]]:
+        """(user_id, JSON data, last_updated) for every record, ready for `executemany`."""
+        with self._lock:
+            records = list(self._records.items())
+        for key, rec in records:
+            yield int(key), json.dumps(rec.get('data')), rec.get('last_updated')
+
+    def compact(self):
+        """Write every record into a fresh snapshot and drop the log it replaces."""
+        with self._lock:
+            if self._log is not None:
+                self._fsync()
+                self._log.close()
+                self._log = None
+            if os.path.exists(self.log_path):
+                if os.path.exists(self.compacting_path):
+                    # an earlier compaction never finished; keep both logs' entries in order
+                    with open(self.compacting_path, 'a', encoding='utf-8') as dst, \
+                            open(self.log_path, 'r', encoding='utf-8') as src:
+                        dst.write(src.read())
+                    os.remove(self.log_path)
+                else:
+                    os.replace(self.log_path, self.compacting_path)
+            records = dict(self._records)
+        tmp = f"{self.snapshot_path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(records, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        try:
+            os.remove(self.compacting_path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._compactions += 1
+
+    def clear(self):
+        """Forget every record and delete the files, e.g. after migrating them to SQLite."""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            self._unsynced = 0
+            for path in (self.log_path, self.compacting_path, self.snapshot_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._records = {}
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            try:
+                with self._lock:
+                    self._fsync()
+                    size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+                if size >= self.compact_bytes:
+                    self.compact()
+            except Exception:
+                logger.exception("Fallback store maintenance failed")
+
+    def close(self):
+        """Fsync the log and stop the background thread."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        with self._lock:
+            if self._log is not None:
+                self._fsync()
+                self._log.close()
+                self._log = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'records': len(self._records),
+                'appends': self._appends,
+                'fsyncs': self._fsyncs,
+                'compactions': self._compactions,
+                'replayed': self._replayed,
+                'log_bytes': os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0,
+            }
@@ -0,0 +1,179 @@
+"""Pooled HTTP client for the Gemini `generateContent` API.
+
+One `requests.Session` is shared by every call, so rewrites reuse warm
+keep-alive connections to generativelanguage.googleapis.com instead of
+paying a DNS lookup and TLS handshake each time. Requests that fail with
+429/5xx or a connection error are retried with full-jitter exponential
+backoff, honouring `Retry-After` when Gemini sends one. `stream` reads
+`streamGenerateContent` as server-sent events and yields text as it arrives.
+"""
+
+import logging
+import os
+import random
+import json
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = 'https://generativelanguage.googleapis.com/v1beta'
+DEFAULT_MODEL = 'gemini-2.0-flash'
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _env_float(name: str, default: float) -> float:
+    val = os.getenv(name)
+    try:
+        return float(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
+class GeminiError(Exception):
+    """Raised when Gemini does not return a usable response after retries."""
+
+
+class GeminiClient:
+    def __init__(self, api_key: Optional[str], model: str = DEFAULT_MODEL, base_url: str = DEFAULT_BASE_URL,
+                 pool_size: int = 10, connect_timeout: float = 3.05, read_timeout: float = 10.0,
+                 max_retries: int = 2, backoff: float = 0.5, max_backoff: float = 8.0):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+        self._seconds = 0.0
+
+    def url(self, method: str = 'generateContent') -> str:
+        return f"{self.base_url}/models/{self.model}:{method}"
+
+    def _delay(self, attempt: int, response: Optional[requests.Response]) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def post(self, body: Dict, method: str = 'generateContent', **kwargs) -> requests.Response:
+        """POST `body` to the model, retrying 429/5xx and connection errors."""
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                response = None
+                try:
+                    response = self.session.post(
+                        self.url(method), json=body, headers={'x-goog-api-key': self.api_key or ''},
+                        timeout=self.timeout, **kwargs
+                    )
+                    if response.status_code not in RETRY_STATUSES:
+                        response.raise_for_status()
+                        return response
+                    error = GeminiError(f"Gemini returned HTTP {response.status_code}")
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = GeminiError(f"Gemini request failed: {e}")
+                except requests.HTTPError as e:
+                    raise GeminiError(str(e))
+                if attempt >= self.max_retries:
+                    raise error
+                delay = self._delay(attempt, response)
+                if response is not None:
+                    response.close()
+                attempt += 1
+                with self._lock:
+                    self._retries += 1
+                logger.warning("%s; retry %s/%s in %.2fs", error, attempt, self.max_retries, delay)
+                time.sleep(delay)
+        except Exception:
+            with self._lock:
+                self._failures += 1
+            raise
+        finally:
+            with self._lock:
+                self._requests += 1
+                self._seconds += time.perf_counter() - started
+
+    @staticmethod
+    def _body(prompt: str, json_mode: bool) -> Dict:
+        body = {"contents": [{"parts": [{"text": prompt}]}]}
+        if json_mode:
+            body["generationConfig"] = {"responseMimeType": "application/json"}
+        return body
+
+    def generate(self, prompt: str, json_mode: bool = False) -> str:
+        """Text of the first candidate for `prompt`."""
+        response = self.post(self._body(prompt, json_mode))
+        try:
+            return response.json()['candidates'][0]['content']['parts'][0]['text']
+        except (ValueError, KeyError, IndexError) as e:
+            raise GeminiError(f"Unexpected Gemini response: {e}")
+
+    def stream(self, prompt: str, json_mode: bool = False) -> Iterator[str]:
+        """Yield text chunks of the first candidate as Gemini produces them.
+
+        Retries only cover the request itself; a stream that breaks part way
+        raises `GeminiError` after the chunks already yielded.
+        """
+        response = self.post(self._body(prompt, json_mode), method='streamGenerateContent',
+                             params={'alt': 'sse'}, stream=True)
+        # SSE is UTF-8, but text/event-stream has no charset so requests would guess ISO-8859-1
+        response.encoding = 'utf-8'
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                try:
+                    event = json.loads(line[5:])
+                    parts = event['candidates'][0]['content']['parts']
+                except (ValueError, KeyError, IndexError):
+                    continue
+                text = ''.join(part.get('text', '') for part in parts)
+                if text:
+                    yield text
+        except requests.RequestException as e:
+            raise GeminiError(f"Gemini stream interrupted: {e}")
+        finally:
+            response.close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'retries': self._retries,
+                'failures': self._failures,
+                'avg_seconds': (self._seconds / self._requests) if self._requests else 0.0,
+            }
+
+
+gemini_client = GeminiClient(
+    api_key=os.getenv('GEMINI_API_KEY'),
+    model=os.getenv('GEMINI_MODEL', DEFAULT_MODEL),
+    base_url=os.getenv('GEMINI_BASE_URL', DEFAULT_BASE_URL),
+    pool_size=int(_env_float('GEMINI_POOL_SIZE', 10)),
+    connect_timeout=_env_float('GEMINI_CONNECT_TIMEOUT', 3.05),
+    read_timeout=_env_float('GEMINI_READ_TIMEOUT', 10),
+    max_retries=int(_env_float('GEMINI_MAX_RETRIES', 2)),
+)
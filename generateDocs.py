@@ -1,15 +1,19 @@
 from datetime import datetime
+import io
 import os
+import time
 import traceback
 from typing import Dict
 from venv import logger
 
 from docx import Document
 from docx.shared import Inches
-from jinja2 import Environment, FileSystemLoader
 from urllib.request import pathname2url  # ✅ Proper path conversion for URI
 
 from ai import enhance_with_ai
+from render_cache import render_cache
+from render_context import render_context
+from template_registry import template_registry
 import logging  # ✅ Correct logger module
 
 logger = logging.getLogger(__name__)  # ✅ Proper logger setup
@@ -24,8 +28,11 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 os.makedirs(TEMP_DIR, exist_ok=True)
 os.makedirs(TEMPLATES_DIR, exist_ok=True)
 
-def generate_pdf(data: Dict) -> str:
-    """Generate PDF CV with robust error handling and photo support"""
+def _safe_filename(name: str) -> str:
+    return "".join(c if c.isalnum() or c in (' ', '_') else '_' for c in name)
+
+def render_pdf_bytes(data: Dict) -> bytes:
+    """Render the PDF CV in memory and return its bytes"""
     try:
         enhanced_data = data.copy()
 
@@ -39,16 +46,7 @@ def generate_pdf(data: Dict) -> str:
             enhanced_data['photo_url'] = None
             logger.info("No valid photo included for PDF")
 
-        # ✅ Set up template environment
-        env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
-        template_name = enhanced_data.get('template', 'professional')
-        template_file = f"{template_name}_cv.html"
-
-        try:
-            template = env.get_template(template_file)
-        except Exception as e:
-            logger.warning(f"Template {template_file} not found. Falling back to default. Reason: {e}")
-            template = env.get_template("professional_cv.html")
+        template_name = template_registry.resolve(enhanced_data.get('template', 'professional'))
 
         # ✅ Add optional fields if missing
         enhanced_data.update({
@@ -63,37 +61,45 @@ def generate_pdf(data: Dict) -> str:
             'education': enhanced_data.get('education', [])
         })
 
-        # ✅ Render the HTML from Jinja2 template
-        html = template.render(enhanced_data)
+        # ✅ Serve identical CVs from the render cache and skip the layout entirely
+        cache_key = render_cache.make_key(enhanced_data, template_name, template_registry.path(template_name))
+        cached = render_cache.get(cache_key)
+        if cached is not None:
+            logger.info("✅ PDF served from render cache")
+            return cached
 
-        # ✅ Create a safe filename for the PDF
-        safe_name = "".join(c if c.isalnum() or c in (' ', '_') else '_' for c in enhanced_data.get('name', 'cv'))
-        filename = os.path.join(TEMP_DIR, f"{safe_name}_CV.pdf")
+        # ✅ Reuse the process-wide compiled template
+        template = template_registry.get(template_name)
 
-        # ✅ Generate PDF using WeasyPrint (import lazily to avoid import-time failures)
-        try:
-            from weasyprint import HTML, CSS
-        except Exception as e:
-            logger.error("WeasyPrint import failed when generating PDF: %s", e)
-            raise RuntimeError(
-                "WeasyPrint cannot be used in this environment. Install GTK/cairo/pango/gdk-pixbuf or run in Docker.\n"
-                f"Original error: {e}"
-            )
+        # ✅ Render the HTML from Jinja2 template
+        html = template.render(enhanced_data)
 
-        html_obj = HTML(string=html)
-        css = CSS(string='@page { size: A4; margin: 1cm; }')
-        html_obj.write_pdf(filename, stylesheets=[css])
+        # ✅ Lay out with the shared WeasyPrint context (fonts and page stylesheet loaded once)
+        started = time.perf_counter()
+        buffer = io.BytesIO()
+        render_context.write_pdf(html, template_name, buffer)
+        pdf_bytes = buffer.getvalue()
+        render_cache.put(cache_key, pdf_bytes, time.perf_counter() - started)
 
-        logger.info(f"✅ PDF successfully generated at: {filename}")
-        return filename
+        logger.info(f"✅ PDF successfully rendered ({len(pdf_bytes)} bytes)")
+        return pdf_bytes
 
     except Exception as e:
         logger.error(f"❌ PDF generation failed: {type(e).__name__}: {str(e)}")
         logger.error(f"Traceback:\n{traceback.format_exc()}")
         raise RuntimeError(f"Failed to generate PDF: {str(e)}")
+
+def generate_pdf(data: Dict) -> str:
+    """Generate PDF CV under temp/ and return its path"""
+    pdf_bytes = render_pdf_bytes(data)
+    filename = os.path.join(TEMP_DIR, f"{_safe_filename(data.get('name', 'cv'))}_CV.pdf")
+    with open(filename, 'wb') as f:
+        f.write(pdf_bytes)
+    logger.info(f"✅ PDF successfully generated at: {filename}")
+    return filename
     
-def generate_docx(data: Dict) -> str:
-    """Generate DOCX version of CV with improved reliability"""
+def render_docx_bytes(data: Dict) -> bytes:
+    """Render the DOCX version of the CV in memory and return its bytes"""
     try:
         enhanced_data = data.copy()  # Don't enhance with AI here to keep it fast
         
@@ -184,18 +190,22 @@ def generate_docx(data: Dict) -> str:
                 if project.get('description'):
                     doc.add_paragraph(project['description'], style='List Bullet')
 
-        # Generate filename and save
-        safe_name = "".join(c if c.isalnum() or c in (' ', '_') else '_' for c in name)
-        filename = os.path.join(TEMP_DIR, f"{safe_name}_CV.docx")
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
-        
-        doc.save(filename)
-        logger.info(f"DOCX successfully generated at: {filename}")
-        return filename
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        docx_bytes = buffer.getvalue()
+        logger.info(f"DOCX successfully rendered ({len(docx_bytes)} bytes)")
+        return docx_bytes
         
     except Exception as e:
         logger.error(f"DOCX generation failed: {type(e).__name__}: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
-        raise RuntimeError(f"Failed to generate DOCX: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Failed to generate DOCX: {str(e)}")
+
+def generate_docx(data: Dict) -> str:
+    """Generate DOCX version of CV under temp/ and return its path"""
+    docx_bytes = render_docx_bytes(data)
+    filename = os.path.join(TEMP_DIR, f"{_safe_filename(data.get('name', 'Your Name'))}_CV.docx")
+    with open(filename, 'wb') as f:
+        f.write(docx_bytes)
+    logger.info(f"DOCX successfully generated at: {filename}")
+    return filename
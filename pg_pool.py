@@ -0,0 +1,198 @@
+"""Shared PostgreSQL connection pool for the analytics modules.
+
+Opening a connection to the managed Postgres costs a TLS handshake, and the
+analytics code used to pay it for every statement. `PgPool` wraps a
+`psycopg2.pool.ThreadedConnectionPool` created on first use. Checkouts block
+(up to `checkout_timeout`) when every connection is busy instead of failing
+straight away. A connection idle for longer than `health_check_after` seconds
+is pinged before it is handed out, and connections that fail with an
+operational error are discarded, so a database failover costs one failed
+statement rather than a restart.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+import psycopg2
+from psycopg2 import pool as pg_pool_module
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection itself is unusable and must be replaced
+_CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def _env_int(name: str, default: int) -> int:
+    val = os.getenv(name)
+    try:
+        return int(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes free within the checkout timeout."""
+
+
+class PgPool:
+    def __init__(self, dsn: Optional[str] = None, minconn: int = 1, maxconn: int = 5,
+                 checkout_timeout: float = 10.0, health_check_after: float = 30.0):
+        # None means read DATABASE_URL on first use, after .env has been loaded
+        self._dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._pool: Optional[pg_pool_module.ThreadedConnectionPool] = None
+        # id(conn) -> monotonic time it was returned to the pool
+        self._idle_since: Dict[int, float] = {}
+        self._checkouts = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._timeouts = 0
+        self._errors = 0
+        self._reconnects = 0
+        self._health_checks = 0
+
+    @property
+    def dsn(self) -> Optional[str]:
+        return self._dsn if self._dsn is not None else os.getenv('DATABASE_URL')
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.dsn)
+
+    def _get_pool(self) -> pg_pool_module.ThreadedConnectionPool:
+        with self._lock:
+            if self._pool is None:
+                if not self.dsn:
+                    raise RuntimeError("DATABASE_URL not set")
+                self._pool = pg_pool_module.ThreadedConnectionPool(self.minconn, self.maxconn, self.dsn)
+                logger.info("PostgreSQL pool opened (min %s, max %s)", self.minconn, self.maxconn)
+            return self._pool
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        idle_since = self._idle_since.get(id(conn))
+        if idle_since is None or time.monotonic() - idle_since < self.health_check_after:
+            return True
+        self._health_checks += 1
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except _CONNECTION_ERRORS:
+            return False
+
+    def _checkout(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(f"No database connection free within {self.checkout_timeout}s")
+        try:
+            pool = self._get_pool()
+            # every pooled connection may have died in a failover; try each once
+            for _ in range(self.maxconn + 1):
+                conn = pool.getconn()
+                if self._healthy(conn):
+                    break
+                logger.warning("Discarding dead PostgreSQL connection")
+                self._discard(pool, conn)
+            else:
+                raise psycopg2.OperationalError("Could not obtain a healthy database connection")
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self._errors += 1
+            raise
+        waited = time.monotonic() - started
+        with self._lock:
+            self._checkouts += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        return pool, conn
+
+    def _discard(self, pool, conn):
+        self._idle_since.pop(id(conn), None)
+        with self._lock:
+            self._reconnects += 1
+        try:
+            pool.putconn(conn, close=True)
+        except Exception:
+            pass
+
+    def _release(self, pool, conn, broken: bool):
+        try:
+            if broken or conn.closed:
+                self._discard(pool, conn)
+            else:
+                self._idle_since[id(conn)] = time.monotonic()
+                pool.putconn(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection; commit on success, roll back on error."""
+        pool, conn = self._checkout()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            broken = isinstance(e, _CONNECTION_ERRORS)
+            with self._lock:
+                self._errors += 1
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self._release(pool, conn, broken)
+
+    @contextmanager
+    def cursor(self):
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                yield cursor
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.closeall()
+            self._idle_since.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'open': self._pool is not None,
+                'min': self.minconn,
+                'max': self.maxconn,
+                'checkouts': self._checkouts,
+                'avg_wait_ms': (self._wait_seconds / self._checkouts * 1000) if self._checkouts else 0.0,
+                'max_wait_ms': self._max_wait_seconds * 1000,
+                'timeouts': self._timeouts,
+                'errors': self._errors,
+                'reconnects': self._reconnects,
+                'health_checks': self._health_checks,
+            }
+
+
+pg_pool = PgPool(
+    minconn=_env_int('PG_POOL_MIN', 1),
+    maxconn=_env_int('PG_POOL_MAX', 5),
+    checkout_timeout=_env_int('PG_POOL_TIMEOUT', 10),
+    health_check_after=_env_int('PG_POOL_HEALTH_CHECK_AFTER', 30),
+)
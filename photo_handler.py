@@ -1,12 +1,51 @@
+import io
+import math
 import os
 import logging
-from typing import Dict, Optional
-from telegram import Update
+from typing import Dict, List, Optional, Union
+from PIL import Image, ImageOps
+from telegram import Bot, PhotoSize, Update
 from telegram.ext import CallbackContext
 import filetype  # Modern alternative to imghdr
 
 logger = logging.getLogger(__name__)
 
+PHOTO_PRINT_DPI = 300
+CSS_PX_PER_INCH = 96
+# The DOCX always embeds the photo at 1.5in, alongside the chosen template
+DOCX_PHOTO_INCHES = 1.5
+# Displayed photo size (CSS px) per template; templates without a photo are absent
+TEMPLATE_PHOTO_CSS_PX = {
+    'professional': 100,
+    'modern': 100,
+    'creative': 120,
+}
+PHOTO_JPEG_QUALITY = 85
+
+# Every CV gets a DOCX, and its photo is larger than any template displays,
+# so one size covers every template and the photo never needs re-fetching
+# once the template is chosen
+PHOTO_MAX_PX = math.ceil(
+    max(DOCX_PHOTO_INCHES, *(px / CSS_PX_PER_INCH for px in TEMPLATE_PHOTO_CSS_PX.values())) * PHOTO_PRINT_DPI
+)
+
+
+def photo_variants(photos: List[PhotoSize]) -> List[Dict]:
+    """Plain-dict copies of Telegram's PhotoSize list, smallest first, safe to keep in user_data."""
+    return sorted(
+        ({'file_id': p.file_id, 'width': p.width, 'height': p.height, 'file_size': p.file_size} for p in photos),
+        key=lambda v: v['width'] * v['height'],
+    )
+
+
+def select_photo_variant(variants: List[Dict], min_px: int) -> Dict:
+    """Smallest variant whose shorter side is at least `min_px`, else the largest available."""
+    for variant in variants:
+        if min(variant['width'], variant['height']) >= min_px:
+            return variant
+    return variants[-1]
+
+
 class PhotoHandler:
     def __init__(self, temp_dir: str = "temp"):
         self.temp_dir = temp_dir
@@ -17,31 +56,10 @@ class PhotoHandler:
     def handle_photo(self, update: Update, context: CallbackContext) -> Dict:
         """Process incoming photo with validation and return file path"""
         try:
-            # Get the highest quality photo available
-            photo_file = update.message.photo[-1].get_file()
             user_id = update.effective_user.id
-            
-            # Check file size before downloading
-            if photo_file.file_size > self.max_size_mb * 1024 * 1024:
-                return {
-                    'success': False,
-                    'message': f"❌ Image too large (max {self.max_size_mb}MB). Please send a smaller photo."
-                }
-
-            # Generate unique filename
-            file_path = os.path.join(self.temp_dir, f"photo_{user_id}_{int(photo_file.file_unique_id, 16)}.jpg")
-            
-            # Download the file
-            photo_file.download(file_path)
-            
-            # Validate the image using filetype
-            kind = filetype.guess(file_path)
-            if kind is None or kind.mime not in self.allowed_types:
-                os.remove(file_path)
-                return {
-                    'success': False,
-                    'message': "❌ Invalid image format. Please send JPEG or PNG."
-                }
+            variants = photo_variants(update.message.photo)
+            file_path = os.path.join(self.temp_dir, f"photo_{user_id}.jpg")
+            self.fetch_photo(context.bot, variants, file_path, PHOTO_MAX_PX)
 
             logger.info(f"Photo successfully saved to {file_path}")
             return {
@@ -50,9 +68,11 @@ class PhotoHandler:
                 'message': "✅ Professional photo received! Now, what's your full name?"
             }
 
+        except ValueError as e:
+            return {'success': False, 'message': f"❌ {e}"}
         except Exception as e:
             logger.error(f"Error handling photo: {str(e)}", exc_info=True)
-            # Clean up if file was partially downloaded
+            # Clean up if file was partially written
             if 'file_path' in locals() and os.path.exists(file_path):
                 os.remove(file_path)
             return {
@@ -60,6 +80,50 @@ class PhotoHandler:
                 'message': "❌ Failed to process photo. Please try again or type /skip to skip."
             }
 
+    def fetch_photo(self, bot: Bot, variants: List[Dict], file_path: str, min_px: int) -> int:
+        """Download the smallest variant covering `min_px` into memory and save it prepared at `file_path`.
+
+        Returns the side of the saved square photo. Raises ValueError when the
+        upload is too large or not a supported image.
+        """
+        variant = select_photo_variant(variants, min_px)
+        if variant.get('file_size') and variant['file_size'] > self.max_size_mb * 1024 * 1024:
+            raise ValueError(f"Image too large (max {self.max_size_mb}MB). Please send a smaller photo.")
+        buffer = io.BytesIO()
+        bot.get_file(variant['file_id']).download(out=buffer)
+        raw = buffer.getvalue()
+        kind = filetype.guess(raw)
+        if kind is None or kind.mime not in self.allowed_types:
+            raise ValueError("Invalid image format. Please send JPEG or PNG.")
+        logger.info(
+            f"Downloaded {variant['width']}x{variant['height']} photo variant "
+            f"({len(raw)} bytes) for {min_px}px"
+        )
+        return self.normalize_photo(io.BytesIO(raw), file_path, max_px=min_px)
+
+    def normalize_photo(self, source: Union[str, io.BytesIO], file_path: str, max_px: int = PHOTO_MAX_PX) -> int:
+        """Save a photo to `file_path` as a small square JPEG ready for embedding.
+
+        Applies the EXIF orientation, centre-crops to a square and downscales
+        to `max_px` so the PDF and DOCX generators embed the same prepared file
+        instead of each decoding the full-resolution upload. Returns the side
+        of the saved square in pixels.
+        """
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel('A'))
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+            side = min(max_px, *img.size)
+            img = ImageOps.fit(img, (side, side), Image.LANCZOS, centering=(0.5, 0.5))
+        img.save(file_path, 'JPEG', quality=PHOTO_JPEG_QUALITY, optimize=True, progressive=True)
+        logger.info(f"Photo normalised to {side}x{side} ({os.path.getsize(file_path)} bytes)")
+        return side
+
     def cleanup_photo(self, file_path: str) -> bool:
         """Safely remove temporary photo file with validation"""
         try:
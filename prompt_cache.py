@@ -0,0 +1,162 @@
+"""Persistent cache of Gemini responses keyed on the prompt.
+
+Users often resubmit the same summary or job description through the edit
+flow, and each resubmission used to cost another Gemini round trip. Entries
+are keyed on a hash of the model name, the response mode and the prompt
+with its whitespace normalised, and live in `prompt_cache.db` next to
+`cv_bot.db`. Entries expire after a TTL and the store is bounded by entry
+count; the least recently used entries are evicted first.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DB_PATH = os.path.join(BASE_DIR, 'prompt_cache.db')
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _env_int(name: str, default: int) -> int:
+    val = os.getenv(name)
+    try:
+        return int(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace runs so re-indented or re-wrapped prompts share an entry."""
+    return _WHITESPACE_RE.sub(' ', prompt).strip()
+
+
+class PromptCache:
+    def __init__(self, db_path: str = CACHE_DB_PATH, ttl_seconds: int = 7 * 24 * 3600,
+                 max_entries: int = 5000, enabled: bool = True):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._conn = None
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._saved_seconds = 0.0
+        if self.enabled:
+            try:
+                self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS prompt_cache (
+                        key TEXT PRIMARY KEY,
+                        model TEXT,
+                        response TEXT,
+                        seconds REAL,
+                        created REAL,
+                        last_used REAL
+                    )
+                    """
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_prompt_cache_last_used ON prompt_cache (last_used)")
+                self._conn.commit()
+            except Exception:
+                logger.exception("Prompt cache unavailable at %s; caching disabled", db_path)
+                self._conn = None
+                self.enabled = False
+
+    @staticmethod
+    def make_key(prompt: str, model: str, json_mode: bool = False) -> str:
+        payload = f"{model}\0{'json' if json_mode else 'text'}\0{normalize_prompt(prompt)}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, prompt: str, model: str, json_mode: bool = False) -> Optional[str]:
+        """Return the cached response for `prompt`, or None on a miss."""
+        if not self.enabled:
+            return None
+        key = self.make_key(prompt, model, json_mode)
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT response, seconds FROM prompt_cache WHERE key=? AND created>?",
+                    (key, now - self.ttl_seconds),
+                ).fetchone()
+                if row:
+                    self._conn.execute("UPDATE prompt_cache SET last_used=? WHERE key=?", (now, key))
+                    self._conn.commit()
+            except Exception:
+                logger.exception("Prompt cache read failed")
+                row = None
+            if row is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._saved_seconds += row[1] or 0.0
+            return row[0]
+
+    def put(self, prompt: str, model: str, response: str, seconds: float = 0.0, json_mode: bool = False):
+        """Store a response and evict expired and least recently used entries over the bound."""
+        if not self.enabled or not response:
+            return
+        key = self.make_key(prompt, model, json_mode)
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO prompt_cache (key, model, response, seconds, created, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, response, seconds, now, now),
+                )
+                self._stores += 1
+                self._evict(now)
+                self._conn.commit()
+            except Exception:
+                logger.exception("Prompt cache write failed")
+
+    def _evict(self, now: float):
+        cur = self._conn.execute("DELETE FROM prompt_cache WHERE created<=?", (now - self.ttl_seconds,))
+        evicted = cur.rowcount
+        cur = self._conn.execute(
+            "DELETE FROM prompt_cache WHERE key IN "
+            "(SELECT key FROM prompt_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._evictions += evicted + cur.rowcount
+
+    def clear(self):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM prompt_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': (self._hits / lookups) if lookups else 0.0,
+                'stores': self._stores,
+                'evictions': self._evictions,
+                'saved_seconds': self._saved_seconds,
+            }
+
+
+prompt_cache = PromptCache(
+    ttl_seconds=_env_int('PROMPT_CACHE_TTL_HOURS', 168) * 3600,
+    max_entries=_env_int('PROMPT_CACHE_MAX_ENTRIES', 5000),
+    enabled=os.getenv('PROMPT_CACHE_ENABLED', '1').strip().lower() not in ('0', 'false', 'no'),
+)
@@ -0,0 +1,222 @@
+"""Content-addressed cache for rendered CV documents.
+
+Entries are keyed on a hash of the template context, the template name and
+the template file contents, so regenerating an identical CV serves the
+stored bytes instead of running another WeasyPrint layout. The store lives
+under `temp/render_cache/` and is bounded by entry count and total size;
+the least recently used entries are evicted first.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMP_DIR = os.path.join(BASE_DIR, 'temp')
+CACHE_DIR = os.path.join(TEMP_DIR, 'render_cache')
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    val = os.getenv(name)
+    try:
+        return int(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
+class RenderCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, max_entries: int = 200,
+                 max_bytes: int = 50 * 1024 * 1024, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # path -> (mtime_ns, size, sha256) for recently hashed files, least recently used first;
+        # a changed file replaces its own entry, so the map holds one entry per path
+        self._file_digests: 'OrderedDict[str, Tuple[int, int, str]]' = OrderedDict()
+        self._max_file_digests = 256
+        # cache file path -> size, seeded by one directory scan on first write so
+        # `put` only has to list the directory when the store goes over budget
+        self._sizes: Optional[Dict[str, int]] = None
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        self._render_seconds = 0.0
+        self._saved_seconds = 0.0
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _file_digest(self, path: Optional[str]) -> Optional[str]:
+        if not path or not os.path.exists(path):
+            return None
+        st = os.stat(path)
+        memo_key = os.path.abspath(path)
+        with self._lock:
+            cached = self._file_digests.get(memo_key)
+            if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+                self._file_digests.move_to_end(memo_key)
+                return cached[2]
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._file_digests[memo_key] = (st.st_mtime_ns, st.st_size, digest)
+            self._file_digests.move_to_end(memo_key)
+            while len(self._file_digests) > self._max_file_digests:
+                self._file_digests.popitem(last=False)
+        return digest
+
+    def make_key(self, context: Dict, template_name: str, template_path: str) -> str:
+        """Return a stable hash for a template context and template file.
+
+        The photo referenced by `photo_path` is hashed by content, so a user
+        replacing their photo under the same filename does not hit a stale entry.
+        """
+        payload = json.dumps(
+            {
+                'context': context,
+                'template': template_name,
+                'template_sha': self._file_digest(template_path),
+                'photo_sha': self._file_digest(context.get('photo_path')),
+            },
+            sort_keys=True,
+            default=str,
+            separators=(',', ':'),
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{ext}")
+
+    def get(self, key: str, ext: str = 'pdf') -> Optional[bytes]:
+        """Return cached bytes for `key`, or None on a miss."""
+        if not self.enabled:
+            return None
+        path = self._path(key, ext)
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            # bump mtime so eviction treats this entry as recently used
+            os.utime(path, None)
+        except FileNotFoundError:
+            with self._lock:
+                self._misses += 1
+            return None
+        except Exception:
+            logger.exception("Render cache read failed for %s", path)
+            with self._lock:
+                self._misses += 1
+            return None
+
+        with self._lock:
+            self._hits += 1
+            if self._stores:
+                self._saved_seconds += self._render_seconds / self._stores
+        return payload
+
+    def put(self, key: str, payload: bytes, render_seconds: float = 0.0, ext: str = 'pdf'):
+        """Store rendered bytes and evict old entries if the store is over budget."""
+        if not self.enabled:
+            return
+        path = self._path(key, ext)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp, path)
+        except Exception:
+            logger.exception("Render cache write failed for %s", path)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._stores += 1
+            self._render_seconds += render_seconds
+            if self._sizes is None:
+                self._sizes = self._scan_sizes()
+                self._total_bytes = sum(self._sizes.values())
+            self._total_bytes += len(payload) - self._sizes.get(path, 0)
+            self._sizes[path] = len(payload)
+            if len(self._sizes) > self.max_entries or self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.tmp') or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _scan_sizes(self) -> Dict[str, int]:
+        return {path: size for _, size, path in self._scan()}
+
+    def _evict(self):
+        # mtimes are bumped on every hit, so recency order comes from the directory
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        entries.sort()
+        while entries and (len(entries) > self.max_entries or total > self.max_bytes):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+                self._evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._sizes = {path: size for _, size, path in entries}
+        self._total_bytes = total
+
+    def clear(self):
+        with self._lock:
+            try:
+                with os.scandir(self.cache_dir) as it:
+                    for entry in it:
+                        if entry.is_file():
+                            os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            self._sizes = None
+            self._total_bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_ratio': (self._hits / lookups) if lookups else 0.0,
+                'stores': self._stores,
+                'evictions': self._evictions,
+                'avg_render_seconds': (self._render_seconds / self._stores) if self._stores else 0.0,
+                'saved_seconds': self._saved_seconds,
+            }
+
+
+render_cache = RenderCache(
+    max_entries=_env_int('RENDER_CACHE_MAX_ENTRIES', 200),
+    max_bytes=_env_int('RENDER_CACHE_MAX_MB', 50) * 1024 * 1024,
+    enabled=os.getenv('RENDER_CACHE_ENABLED', '1').strip().lower() not in ('0', 'false', 'no'),
+)
@@ -0,0 +1,72 @@
+"""Long-lived WeasyPrint state shared across PDF renders.
+
+A fresh render re-parses the A4 page stylesheet and rediscovers fonts
+through fontconfig. `RenderContext` keeps one `FontConfiguration` and the
+parsed page stylesheet and hands them to every `write_pdf` call. Each
+template's `<style>` block stays in the rendered HTML: WeasyPrint treats CSS
+passed through `stylesheets=` as user-origin, so moving the template CSS
+there would change how its `@page`, `!important` and inline-style rules
+cascade. The HTML uses the template file as its base URL so relative
+`url()` references resolve.
+"""
+
+import logging
+import os
+import threading
+from typing import Optional
+
+from template_registry import template_registry
+
+PAGE_CSS = '@page { size: A4; margin: 1cm; }'
+
+logger = logging.getLogger(__name__)
+
+
+def _import_weasyprint():
+    # Imported lazily so the bot can start without cairo/pango installed
+    try:
+        import weasyprint
+        from weasyprint.text.fonts import FontConfiguration
+    except Exception as e:
+        logger.error("WeasyPrint import failed when generating PDF: %s", e)
+        raise RuntimeError(
+            "WeasyPrint cannot be used in this environment. Install GTK/cairo/pango/gdk-pixbuf or run in Docker.\n"
+            f"Original error: {e}"
+        )
+    return weasyprint, FontConfiguration
+
+
+class RenderContext:
+    def __init__(self, page_css: str = PAGE_CSS):
+        self.page_css = page_css
+        self._lock = threading.Lock()
+        self._font_config = None
+        self._page_stylesheet = None
+
+    def _ensure_base(self):
+        with self._lock:
+            if self._font_config is None:
+                weasyprint, FontConfiguration = _import_weasyprint()
+                font_config = FontConfiguration()
+                self._page_stylesheet = weasyprint.CSS(string=self.page_css, font_config=font_config)
+                self._font_config = font_config
+
+    def write_pdf(self, html: str, template_name: str, target=None) -> Optional[bytes]:
+        """Lay out `html` rendered from `template_name` and write the PDF to `target`."""
+        self._ensure_base()
+        weasyprint, _ = _import_weasyprint()
+        # the template's own <style> stays author-origin CSS inside the document;
+        # only the shared page rules come in as a user stylesheet, as before
+        return weasyprint.HTML(string=html, base_url=template_registry.path(template_name)).write_pdf(
+            target, stylesheets=[self._page_stylesheet], font_config=self._font_config
+        )
+
+    def warm(self):
+        """Load fonts and parse the page stylesheet ahead of the first CV."""
+        try:
+            self._ensure_base()
+        except Exception as e:
+            logger.warning("Failed to prepare the PDF render context: %s", e)
+
+
+render_context = RenderContext()
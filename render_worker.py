@@ -0,0 +1,336 @@
+"""Process pool that renders CV documents off the bot's dispatcher threads.
+
+WeasyPrint layout is CPU-bound pure Python, so rendering in the bot process
+serialises every user behind the GIL. Jobs are handed to a pool of worker
+processes that import WeasyPrint and python-docx, compile the templates and
+load fonts and the page stylesheet once when they start, with the PDF and
+DOCX of a CV rendered as separate tasks so they overlap.
+Submission is bounded: when a CV's tasks would push more than `max_queue`
+tasks into the wait for a worker, `submit` raises `RenderQueueFull` instead
+of queueing forever. Every counter the pool keeps is in tasks, so a CV with
+a PDF and a DOCX counts twice.
+Each worker reports when it picks a task up, and a task's timeout counts
+from that moment: a task that overruns it gets the pool recycled so a
+pathological CV cannot keep a worker busy indefinitely, while a task that
+is still waiting in the queue after `queue_timeout` is just cancelled.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor
+from concurrent.futures import wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# how often a waiting job checks its tasks' deadlines
+_POLL_SECONDS = 0.25
+
+# set in each worker by the pool initializer; (task_id, pid, started_at) goes here
+_started_queue = None
+
+
+def _env_int(name: str, default: int) -> int:
+    val = os.getenv(name)
+    try:
+        return int(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
+def _warm_worker(started_queue=None):
+    """Pool initializer: import the heavy rendering modules once per worker."""
+    global _started_queue
+    _started_queue = started_queue
+    try:
+        import weasyprint  # noqa: F401
+    except Exception as e:
+        # generate_pdf reports a clear error for each job if this stays broken
+        logger.warning("WeasyPrint import failed in render worker %s: %s", os.getpid(), e)
+    import docx  # noqa: F401
+    import generateDocs  # noqa: F401
+    from render_context import render_context
+    from template_registry import template_registry
+
+    template_registry.warm()
+    render_context.warm()
+
+
+def _noop() -> int:
+    return os.getpid()
+
+
+def _render_document(kind: str, data: Dict, task_id: Optional[int] = None) -> Tuple[bytes, float, int, Dict]:
+    """Worker entry point: render one document and report timing and cache stats."""
+    from generateDocs import render_docx_bytes, render_pdf_bytes
+    from render_cache import render_cache
+
+    if _started_queue is not None and task_id is not None:
+        # lets the pool start this task's timeout now rather than at submission
+        _started_queue.put((task_id, os.getpid(), time.time()))
+    started = time.perf_counter()
+    payload = render_pdf_bytes(data) if kind == 'pdf' else render_docx_bytes(data)
+    return payload, time.perf_counter() - started, os.getpid(), render_cache.stats()
+
+
+class RenderQueueFull(Exception):
+    """Raised when the render queue is at its maximum depth."""
+
+
+class RenderTimeout(Exception):
+    """Raised when a render job does not finish within its timeout."""
+
+
+class RenderJob:
+    """Handle for one CV: one future per document kind, rendered in parallel."""
+
+    def __init__(self, pool: 'RenderPool', futures: Dict[str, Future], tasks: Dict[str, int], position: int):
+        self._pool = pool
+        self.futures = futures
+        # kind -> task id the worker reports when it starts
+        self.tasks = tasks
+        # tasks ahead of this job's first one, plus one; 0 means a worker picked it up immediately
+        self.position = position
+        self._submitted_at = time.time()
+
+    def as_completed(self, timeout: Optional[float] = None) -> Iterator[Tuple[str, bytes, float]]:
+        """Yield (kind, document_bytes, render_seconds) for each document as soon as it is ready.
+
+        The timeout applies to each document from the moment a worker starts
+        it. A document still running past it gets the pool recycled, killing
+        the stuck worker; one still queued after the pool's `queue_timeout`
+        is cancelled without touching the workers.
+        """
+        timeout = self._pool.job_timeout if timeout is None else timeout
+        kinds = {future: kind for kind, future in self.futures.items()}
+        remaining = set(kinds)
+        while remaining:
+            done, remaining = futures_wait(remaining, timeout=_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                payload, seconds, _, _ = future.result()
+                yield kinds[future], payload, seconds
+            if not remaining:
+                return
+            now = time.time()
+            overdue = []
+            queued_too_long = False
+            for future in remaining:
+                started_at = self._pool._started_at(self.tasks[kinds[future]])
+                if started_at is None:
+                    queued_too_long |= now - self._submitted_at > self._pool.queue_timeout
+                elif now - started_at > timeout:
+                    overdue.append(future)
+            if overdue or queued_too_long:
+                for future in remaining:
+                    # only succeeds for tasks no worker has picked up yet
+                    future.cancel()
+                self._pool._record_timeout(overdue)
+                if overdue:
+                    raise RenderTimeout(f"Render job exceeded {timeout}s")
+                raise RenderTimeout(f"Render job still queued after {self._pool.queue_timeout}s")
+
+    def result(self, timeout: Optional[float] = None) -> Dict[str, bytes]:
+        """Wait for every document and return {kind: document_bytes}."""
+        return {kind: payload for kind, payload, _ in self.as_completed(timeout)}
+
+
+class RenderPool:
+    def __init__(self, max_workers: int = 2, max_queue: int = 20, job_timeout: float = 60.0,
+                 queue_timeout: float = 120.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.queue_timeout = queue_timeout
+        # re-entrant: cancelling futures during a recycle runs _on_done inline
+        self._lock = threading.RLock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # workers report task starts here; shared by every executor the pool creates
+        self._started_queue = None
+        self._watcher: Optional[threading.Thread] = None
+        self._task_ids = itertools.count(1)
+        # task id -> wall-clock start reported by its worker, None while queued
+        self._task_started: Dict[int, Optional[float]] = {}
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._recycles = 0
+        self._worker_cache_stats: Dict[int, Dict] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            if self._started_queue is None:
+                self._started_queue = multiprocessing.Queue()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers, initializer=_warm_worker, initargs=(self._started_queue,)
+            )
+        return self._executor
+
+    def _start_watcher(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch_starts, name='render-starts', daemon=True)
+            self._watcher.start()
+
+    def _watch_starts(self):
+        while True:
+            message = self._started_queue.get()
+            if message is None:
+                return
+            task_id, _, started_at = message
+            with self._lock:
+                # a task that already finished has been forgotten; don't resurrect it
+                if task_id in self._task_started:
+                    self._task_started[task_id] = started_at
+
+    def _started_at(self, task_id: int) -> Optional[float]:
+        with self._lock:
+            return self._task_started.get(task_id)
+
+    def start(self):
+        """Spawn and warm the workers now instead of on the first CV.
+
+        Call this before the bot starts its own threads so workers are forked
+        from a quiet process.
+        """
+        with self._lock:
+            executor = self._get_executor()
+            futures = [executor.submit(_noop) for _ in range(self.max_workers)]
+            # after the workers are forked, so they don't inherit this thread
+            self._start_watcher()
+        for f in futures:
+            try:
+                f.result(timeout=self.job_timeout)
+            except Exception as e:
+                logger.warning("Render worker warm-up failed: %s", e)
+        logger.info("Render pool started with %s workers", self.max_workers)
+
+    def submit(self, data: Dict, kinds: Iterable[str] = ('pdf', 'docx')) -> RenderJob:
+        """Queue a CV for rendering and return a `RenderJob` handle.
+
+        Each document kind is a separate task so the PDF and DOCX render on
+        different workers at the same time.
+        """
+        kinds = list(kinds)
+        with self._lock:
+            # tasks already waiting for a worker, ahead of this CV's
+            waiting = max(0, self._pending - self.max_workers)
+            if waiting + len(kinds) > self.max_queue:
+                self._rejected += len(kinds)
+                raise RenderQueueFull(f"{self._pending} render tasks pending")
+            tasks = {kind: next(self._task_ids) for kind in kinds}
+            try:
+                futures = self._submit_all(data, tasks)
+            except BrokenProcessPool:
+                logger.warning("Render pool broken; recycling before resubmitting")
+                self._shutdown_executor()
+                futures = self._submit_all(data, tasks)
+            self._start_watcher()
+            for task_id in tasks.values():
+                self._task_started[task_id] = None
+            # 0 when a worker is free for the first task
+            position = waiting + 1 if self._pending >= self.max_workers else 0
+            self._pending += len(tasks)
+            self._submitted += len(tasks)
+            job = RenderJob(self, futures, tasks, position)
+        for kind, future in futures.items():
+            future.add_done_callback(partial(self._on_done, job, tasks[kind]))
+        return job
+
+    def _submit_all(self, data: Dict, tasks: Dict[str, int]) -> Dict[str, Future]:
+        executor = self._get_executor()
+        return {kind: executor.submit(_render_document, kind, data, task_id) for kind, task_id in tasks.items()}
+
+    def _on_done(self, job: RenderJob, task_id: int, future: Future):
+        with self._lock:
+            self._task_started.pop(task_id, None)
+            self._pending -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._failed += 1
+                return
+            self._completed += 1
+            _, _, pid, cache_stats = future.result()
+            self._worker_cache_stats[pid] = cache_stats
+
+    def _record_timeout(self, overdue: Iterable[Future]):
+        """Count a timed-out job and recycle the pool if one of its own tasks is still running."""
+        with self._lock:
+            self._timeouts += 1
+            if all(f.done() for f in overdue):
+                return
+            logger.error("Render task overran its timeout; recycling render pool")
+            self._shutdown_executor()
+
+    def _shutdown_executor(self):
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        self._recycles += 1
+        # ProcessPoolExecutor has no public way to stop a running task, so
+        # terminate the worker processes; their futures fail with BrokenProcessPool.
+        for proc in list(getattr(executor, '_processes', {}).values()):
+            try:
+                proc.terminate()
+            except Exception:
+                pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            watcher, self._watcher = self._watcher, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if watcher is not None:
+            self._started_queue.put(None)
+            watcher.join(5)
+
+    def cache_stats(self) -> Dict:
+        """Render cache stats summed over the workers that reported in."""
+        with self._lock:
+            per_worker: List[Dict] = list(self._worker_cache_stats.values())
+        hits = sum(s['hits'] for s in per_worker)
+        misses = sum(s['misses'] for s in per_worker)
+        stores = sum(s['stores'] for s in per_worker)
+        render_seconds = sum(s['avg_render_seconds'] * s['stores'] for s in per_worker)
+        return {
+            'enabled': all(s['enabled'] for s in per_worker) if per_worker else True,
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': (hits / (hits + misses)) if hits + misses else 0.0,
+            'stores': stores,
+            'evictions': sum(s['evictions'] for s in per_worker),
+            'avg_render_seconds': (render_seconds / stores) if stores else 0.0,
+            'saved_seconds': sum(s['saved_seconds'] for s in per_worker),
+        }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'pending': self._pending,
+                'queued': max(0, self._pending - self.max_workers),
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'recycles': self._recycles,
+            }
+
+
+render_pool = RenderPool(
+    max_workers=_env_int('RENDER_WORKERS', min(2, os.cpu_count() or 1)),
+    max_queue=_env_int('RENDER_MAX_QUEUE', 20),
+    job_timeout=_env_int('RENDER_JOB_TIMEOUT', 60),
+    queue_timeout=_env_int('RENDER_QUEUE_TIMEOUT', 120),
+)
@@ -0,0 +1,88 @@
+"""Process-wide registry of the CV templates in `templates/`.
+
+Every render shares one Jinja `Environment`, so each `*_cv.html` template is
+parsed and compiled once per process instead of once per CV. `auto_reload`
+makes Jinja recompile a template when its file's mtime changes. Set
+`JINJA_BYTECODE_CACHE=1` to also persist compiled bytecode under
+`temp/jinja_cache/` so new worker processes skip compilation too.
+"""
+
+import logging
+import os
+from typing import List, Optional
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMP_DIR = os.path.join(BASE_DIR, 'temp')
+TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
+BYTECODE_CACHE_DIR = os.path.join(TEMP_DIR, 'jinja_cache')
+
+TEMPLATE_SUFFIX = '_cv.html'
+DEFAULT_TEMPLATE = 'professional'
+
+logger = logging.getLogger(__name__)
+
+
+class TemplateRegistry:
+    def __init__(self, templates_dir: str = TEMPLATES_DIR, bytecode_cache_dir: Optional[str] = None,
+                 default: str = DEFAULT_TEMPLATE):
+        self.templates_dir = templates_dir
+        self.default = default
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+        self.env = Environment(
+            loader=FileSystemLoader(templates_dir),
+            auto_reload=True,
+            bytecode_cache=bytecode_cache,
+        )
+        self._names: List[str] = []
+        self._dir_mtime: Optional[float] = None
+
+    def names(self) -> List[str]:
+        """Template names (e.g. 'modern') available in the templates directory."""
+        try:
+            mtime = os.stat(self.templates_dir).st_mtime
+        except FileNotFoundError:
+            return []
+        if mtime != self._dir_mtime:
+            self._names = sorted(
+                f[:-len(TEMPLATE_SUFFIX)] for f in os.listdir(self.templates_dir) if f.endswith(TEMPLATE_SUFFIX)
+            )
+            self._dir_mtime = mtime
+        return self._names
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names()
+
+    def filename(self, name: str) -> str:
+        return f"{name}{TEMPLATE_SUFFIX}"
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.templates_dir, self.filename(name))
+
+    def resolve(self, name: Optional[str]) -> str:
+        """Return `name` if it is a registered template, else the default."""
+        if name and name in self:
+            return name
+        logger.warning("Template %r not registered. Falling back to %s.", name, self.default)
+        return self.default
+
+    def get(self, name: str) -> Template:
+        return self.env.get_template(self.filename(self.resolve(name)))
+
+    def warm(self):
+        """Compile every registered template now rather than on first use."""
+        for name in self.names():
+            try:
+                self.env.get_template(self.filename(name))
+            except Exception:
+                logger.exception("Failed to compile template %s", name)
+        logger.info("Compiled %s CV templates", len(self.names()))
+
+
+template_registry = TemplateRegistry(
+    bytecode_cache_dir=BYTECODE_CACHE_DIR if os.getenv('JINJA_BYTECODE_CACHE', '').strip().lower() in ('1', 'true', 'yes') else None,
+)
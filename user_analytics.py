@@ -1,47 +1,114 @@
+import atexit
 import os
 import logging
-import psycopg2
-from datetime import datetime
-from typing import Dict, Any, Union
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Union
 import json
 from contextlib import contextmanager
+from psycopg2.extras import execute_values
 from telegram import Update
 
+from analytics_schema import migrate
+from event_queue import BatchQueue
+from pg_pool import pg_pool
+
 # Initialize logger
 logger = logging.getLogger(__name__)
 
+
+def _env_int(name: str, default: int) -> int:
+    val = os.getenv(name)
+    try:
+        return int(val) if val and val.strip() else default
+    except ValueError:
+        logger.warning("Invalid %s value %r, using default %s", name, val, default)
+        return default
+
+
+# One queued analytics write; `payload` depends on `kind` (action/session/feedback)
+AnalyticsEvent = namedtuple(
+    'AnalyticsEvent', 'kind user_id username first_name last_name timestamp payload'
+)
+
 class UserAnalytics:
     def __init__(self):
         self.db_url = os.getenv('DATABASE_URL')
         self.enabled = False
+        # Handlers only enqueue; a background writer inserts events in batches
+        self.events = BatchQueue(
+            self._write_events,
+            name='analytics events',
+            max_queue=_env_int('ANALYTICS_QUEUE_MAX', 10000),
+            batch_size=_env_int('ANALYTICS_BATCH_SIZE', 200),
+            flush_interval=_env_int('ANALYTICS_FLUSH_MS', 500) / 1000,
+        )
+        # user_id -> [username, first_name, last_name, last_seen written, latest last_seen]
+        # for users whose row is known to be current, least recently used first
+        self._user_cache: 'OrderedDict[int, list]' = OrderedDict()
+        self._user_cache_size = _env_int('ANALYTICS_USER_CACHE_SIZE', 10000)
+        self._last_seen_window = timedelta(seconds=_env_int('ANALYTICS_LAST_SEEN_WINDOW', 300))
+        # cached users whose latest last_seen is newer than the stored one
+        self._last_seen_dirty = set()
+        # latest last_seen of evicted users that was never written
+        self._evicted_last_seen: Dict[int, datetime] = {}
+        self._user_lock = threading.Lock()
+        self._upserts = 0
+        self._upserts_skipped = 0
+        self._last_seen_updates = 0
+
+    def start(self):
+        """Connect, create the tables and start the event writer.
+
+        Kept out of `__init__` so importing this module opens no connections
+        and starts no threads; the bot calls it after the render workers are
+        forked.
+        """
+        if self.enabled:
+            return
         if not self.db_url:
             logger.warning("DATABASE_URL not set, analytics disabled")
             return
 
         try:
-            self._init_db()
+            # _get_cursor refuses to run while disabled
             self.enabled = True
+            self._init_db()
+            self.events.start()
+            atexit.register(self.close)
             logger.info("Analytics enabled (database connected)")
         except Exception as e:
             logger.exception("Failed to initialize analytics DB, analytics disabled: %s", e)
             self.enabled = False
 
+    def close(self):
+        """Flush queued events and pending last_seen updates to the database"""
+        self.events.stop()
+        if not self.enabled:
+            return
+        try:
+            with self._user_lock:
+                due = self._last_seen_due(force=True)
+            if due:
+                with self._get_cursor() as cursor:
+                    self._write_last_seen(cursor, due)
+                with self._user_lock:
+                    self._mark_last_seen_written(due)
+        except Exception as e:
+            logger.error(f"Error flushing last_seen updates: {e}", exc_info=True)
+
     @contextmanager
     def _get_cursor(self):
         if not self.enabled:
             raise RuntimeError("Database not available")
 
-        conn = psycopg2.connect(self.db_url)
         try:
-            cursor = conn.cursor()
-            yield cursor
-            conn.commit()
+            with pg_pool.cursor() as cursor:
+                yield cursor
         except Exception as e:
-            conn.rollback()
             logger.error(f"Database error: {e}", exc_info=True)
             raise
-        finally:
-            conn.close()
 
     def _init_db(self):
         """Initialize database tables with username support"""
@@ -98,20 +165,130 @@ class UserAnalytics:
                 )
             ''')
 
-    def _update_user_info(self, user_id: int, username: str = None, 
-                         first_name: str = None, last_name: str = None):
-        """Update or create user record"""
+            # Indexes, partitioning and rollups are versioned migrations
+            migrate(cursor)
+
+    def _write_events(self, events: List[AnalyticsEvent]):
+        """Write a batch of queued events in one transaction"""
+        # One users row per user: ON CONFLICT cannot touch the same row twice
+        users: Dict[int, tuple] = {}
+        actions, sessions, feedback = [], [], []
+        for e in events:
+            prev = users.get(e.user_id, (e.user_id, None, None, None, e.timestamp))
+            users[e.user_id] = (
+                e.user_id,
+                e.username or prev[1],
+                e.first_name or prev[2],
+                e.last_name or prev[3],
+                max(e.timestamp, prev[4]),
+            )
+            if e.kind == 'action':
+                action_type, action_data = e.payload
+                actions.append((e.user_id, action_type, json.dumps(action_data) if action_data else None, e.timestamp))
+            elif e.kind == 'session':
+                sessions.append((e.user_id, e.username, e.timestamp))
+            elif e.kind == 'feedback':
+                rating, comments = e.payload
+                feedback.append((e.user_id, e.username, rating, comments, e.timestamp))
+
+        with self._user_lock:
+            upserts = self._users_needing_upsert(users.values())
+            last_seen = self._last_seen_due()
+
         with self._get_cursor() as cursor:
-            cursor.execute('''
-                INSERT INTO users (user_id, username, first_name, last_name)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET 
-                    username = COALESCE(EXCLUDED.username, users.username),
-                    first_name = COALESCE(EXCLUDED.first_name, users.first_name),
-                    last_name = COALESCE(EXCLUDED.last_name, users.last_name),
-                    last_seen = CURRENT_TIMESTAMP
-            ''', (user_id, username, first_name, last_name))
+            if upserts:
+                execute_values(cursor, '''
+                    INSERT INTO users (user_id, username, first_name, last_name, last_seen)
+                    VALUES %s
+                    ON CONFLICT (user_id) 
+                    DO UPDATE SET 
+                        username = COALESCE(EXCLUDED.username, users.username),
+                        first_name = COALESCE(EXCLUDED.first_name, users.first_name),
+                        last_name = COALESCE(EXCLUDED.last_name, users.last_name),
+                        last_seen = GREATEST(EXCLUDED.last_seen, users.last_seen)
+                ''', upserts)
+            if last_seen:
+                self._write_last_seen(cursor, last_seen)
+            if actions:
+                execute_values(cursor, '''
+                    INSERT INTO user_actions (user_id, action_type, action_data, timestamp)
+                    VALUES %s
+                ''', actions)
+            if sessions:
+                execute_values(cursor, '''
+                    INSERT INTO user_sessions (user_id, username, session_start)
+                    VALUES %s
+                ''', sessions)
+            if feedback:
+                execute_values(cursor, '''
+                    INSERT INTO user_feedback (user_id, username, rating, comments, timestamp)
+                    VALUES %s
+                ''', feedback)
+
+        with self._user_lock:
+            self._remember_users(upserts)
+            self._mark_last_seen_written(last_seen)
+
+    def _users_needing_upsert(self, rows) -> List[tuple]:
+        """Drop users whose cached profile is unchanged; their last_seen is batched instead"""
+        upserts = []
+        for row in rows:
+            user_id, seen = row[0], row[4]
+            cached = self._user_cache.get(user_id)
+            # None means "not known" and never overwrites a stored value
+            if cached is not None and all(new is None or new == old for new, old in zip(row[1:4], cached[:3])):
+                self._user_cache.move_to_end(user_id)
+                if seen > cached[4]:
+                    cached[4] = seen
+                    self._last_seen_dirty.add(user_id)
+                self._upserts_skipped += 1
+            else:
+                upserts.append(row)
+        return upserts
+
+    def _last_seen_due(self, force: bool = False) -> List[tuple]:
+        """(user_id, last_seen) for cached users whose stored last_seen is older than the window"""
+        due = dict(self._evicted_last_seen)
+        for user_id in self._last_seen_dirty:
+            _, _, _, written, latest = self._user_cache[user_id]
+            if force or latest - written >= self._last_seen_window:
+                due[user_id] = latest
+        return list(due.items())
+
+    def _write_last_seen(self, cursor, rows: List[tuple]):
+        execute_values(cursor, '''
+            UPDATE users SET last_seen = v.last_seen
+            FROM (VALUES %s) AS v(user_id, last_seen)
+            WHERE users.user_id = v.user_id AND users.last_seen < v.last_seen
+        ''', rows)
+
+    def _remember_users(self, rows: List[tuple]):
+        for user_id, username, first_name, last_name, seen in rows:
+            cached = self._user_cache.pop(user_id, None)
+            if cached is not None:
+                username = username if username is not None else cached[0]
+                first_name = first_name if first_name is not None else cached[1]
+                last_name = last_name if last_name is not None else cached[2]
+                seen = max(seen, cached[4])
+            self._user_cache[user_id] = [username, first_name, last_name, seen, seen]
+            self._last_seen_dirty.discard(user_id)
+            self._upserts += 1
+        while len(self._user_cache) > self._user_cache_size:
+            user_id, (_, _, _, written, latest) = self._user_cache.popitem(last=False)
+            if user_id in self._last_seen_dirty:
+                self._last_seen_dirty.discard(user_id)
+                self._evicted_last_seen[user_id] = latest
+
+    def _mark_last_seen_written(self, rows: List[tuple]):
+        for user_id, seen in rows:
+            if self._evicted_last_seen.get(user_id) == seen:
+                del self._evicted_last_seen[user_id]
+            cached = self._user_cache.get(user_id)
+            if cached is not None:
+                cached[3] = max(cached[3], seen)
+                if cached[3] >= cached[4]:
+                    self._last_seen_dirty.discard(user_id)
+        self._last_seen_updates += len(rows)
 
     def _get_user_info(self, user_source: Union[Update, int]):
         """Extract user info from either Update object or user_id"""
@@ -120,61 +297,53 @@ class UserAnalytics:
             return user.id, user.username, user.first_name, user.last_name
         return user_source, None, None, None
 
+    def _enqueue(self, kind: str, user_source: Union[Update, int], payload: Any = None):
+        user_id, username, first_name, last_name = self._get_user_info(user_source)
+        self.events.put(AnalyticsEvent(kind, user_id, username, first_name, last_name, datetime.now(), payload))
+
     def log_action(self, user_source: Union[Update, int], action_type: str, action_data: Dict[str, Any] = None):
-        """Log a user action with username"""
+        """Queue a user action with username"""
         if not self.enabled:
             logger.debug("Analytics disabled — skipping log_action")
             return
 
-        user_id, username, first_name, last_name = self._get_user_info(user_source)
         try:
-            self._update_user_info(user_id, username, first_name, last_name)
-
-            with self._get_cursor() as cursor:
-                cursor.execute('''
-                    INSERT INTO user_actions (user_id, action_type, action_data)
-                    VALUES (%s, %s, %s)
-                ''', (user_id, action_type, json.dumps(action_data) if action_data else None))
+            self._enqueue('action', user_source, (action_type, action_data))
         except Exception as e:
             logger.error(f"Error logging action: {e}", exc_info=True)
 
     def start_session(self, user_source: Union[Update, int]):
-        """Record session start with username"""
+        """Queue a session start with username"""
         if not self.enabled:
             logger.debug("Analytics disabled — skipping start_session")
             return
 
-        user_id, username, first_name, last_name = self._get_user_info(user_source)
         try:
-            self._update_user_info(user_id, username, first_name, last_name)
-
-            with self._get_cursor() as cursor:
-                cursor.execute('''
-                    INSERT INTO user_sessions (user_id, username, session_start)
-                    VALUES (%s, %s, %s)
-                ''', (user_id, username, datetime.now()))
+            self._enqueue('session', user_source)
         except Exception as e:
             logger.error(f"Error starting session: {e}", exc_info=True)
 
     def record_feedback(self, user_source: Union[Update, int], rating: int = None, comments: str = None):
-        """Store user feedback with username"""
+        """Queue user feedback with username"""
         if not self.enabled:
             logger.debug("Analytics disabled — skipping record_feedback")
             return
 
         try:
-            user_id, username, first_name, last_name = self._get_user_info(user_source)
-            logger.info(f"Recording feedback for user {user_id}, rating: {rating}")
-
-            self._update_user_info(user_id, username, first_name, last_name)
-
-            with self._get_cursor() as cursor:
-                cursor.execute('''
-                    INSERT INTO user_feedback (user_id, username, rating, comments)
-                    VALUES (%s, %s, %s, %s)
-                ''', (user_id, username, rating, comments))
-                logger.info("Feedback successfully recorded")
+            self._enqueue('feedback', user_source, (rating, comments))
+            logger.info("Feedback queued for recording, rating: %s", rating)
         except Exception as e:
             logger.error(f"Error recording feedback: {e}", exc_info=True)
 
+    def stats(self) -> Dict:
+        """Event queue depth, dropped events, flush latency and user cache counters"""
+        with self._user_lock:
+            users = {
+                'user_cache_size': len(self._user_cache),
+                'upserts': self._upserts,
+                'upserts_skipped': self._upserts_skipped,
+                'last_seen_updates': self._last_seen_updates,
+            }
+        return dict(self.events.stats(), enabled=self.enabled, **users)
+
 analytics = UserAnalytics()
\ No newline at end of file